@@ -1,4 +1,4 @@
-import json
+from g3_payless.visualization.stats_file import read_stats
 
 # Change these parameters as required 
 PATH_TO_JSON = '/vagrant_data/artifacts/'
@@ -41,7 +41,8 @@ def load_json_data(monitor_type):
         - monitor_type (str): Monitoring type
     
     Returns:
-        - Returns the entire json data 
+        - Returns the entire json data. Statistics logs and columnar
+          statistics directories are converted to the same format.
     """
 
     if monitor_type == 'adaptive':
@@ -49,10 +50,7 @@ def load_json_data(monitor_type):
     else:
         path = PATH_TO_JSON + POLLING_JSON
 
-    with open(path) as f:
-        json_data = json.load(f) 
-
-    return json_data
+    return read_stats(path)
 
 
 def select_requested_data(json_data, metric, aggregation_level):
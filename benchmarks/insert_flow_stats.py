@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the cost of recording flow statistics samples, comparing the
+per-sample dictionaries that were used originally to the time series used
+by MonitoringAlgorithm, once per sample and once per FlowStatsReply
+"""
+
+import gc
+import time
+import logging
+import argparse
+import tracemalloc
+from collections import namedtuple
+from g3_payless.flows.FlowsView import FlowsView
+from g3_payless.monitoring.MonitoringAlgorithm import MonitoringAlgorithm
+
+
+FlowStats = namedtuple(
+    "FlowStats", ["cookie", "byte_count", "duration_sec", "duration_nsec"]
+)
+"""
+Stand-in for the OFPFlowStats entries of a FlowStatsReply
+"""
+
+
+class App(object):
+    """
+    The parts of the MonitoringFramework used by MonitoringAlgorithm
+    """
+
+    STATISTICS_RETENTION = 3600
+    STATISTICS_DOWNSAMPLING = 10
+    STATISTICS_ARCHIVE_RETENTION = 3600
+
+    def __init__(self, flow_count):
+        self.active_flows = {flow_id: None for flow_id in range(flow_count)}
+        self.removed_flows = {}
+        self.all_flows = FlowsView(self.active_flows, self.removed_flows)
+
+
+def generate_replies(flow_count, sample_count):
+    """
+    :return: One reply per polling round, containing every flow
+    :rtype: list
+    """
+    return [
+        [
+            FlowStats(flow_id, round_index * 1000, round_index, 5000000)
+            for flow_id in range(flow_count)
+        ]
+        for round_index in range(1, sample_count + 1)
+    ]
+
+
+def insert_dicts(replies):
+    """
+    Records the samples in dictionaries, like insert_flow_stats originally did
+    """
+    logger = logging.getLogger(__name__)
+    statistics = {}
+    flow_states = {}
+    for reply in replies:
+        for flow in reply:
+            flow_id = flow.cookie
+            duration = flow.duration_sec * 1000 + flow.duration_nsec // 1000000
+            if flow_id not in flow_states:
+                flow_states[flow_id] = {"total_bytes": 0, "duration": 0}
+            current = flow_states[flow_id]
+            flow_states[flow_id] = {
+                "total_bytes": flow.byte_count,
+                "duration": duration
+            }
+            if flow_id not in statistics:
+                statistics[flow_id] = {}
+            bytes_diff = flow.byte_count - current["total_bytes"]
+            duration_diff = duration - current["duration"]
+            statistics[flow_id][time.time()] = {
+                "bytes": bytes_diff,
+                "duration": duration_diff,
+                "total_bytes": current["total_bytes"],
+                "total_duration": current["duration"]
+            }
+            logger.debug("[F{}] Stats: bytes={}, duration={}"
+                         .format(flow_id, bytes_diff, duration_diff))
+    return statistics, flow_states
+
+
+def insert_per_sample(replies):
+    """
+    Records the samples by calling insert_flow_stats for every sample
+    """
+    algorithm = MonitoringAlgorithm(App(len(replies[0])))
+    for reply in replies:
+        for flow in reply:
+            algorithm.insert_flow_stats(
+                flow.cookie,
+                flow.byte_count,
+                algorithm.calculate_duration_msec(flow)
+            )
+    return algorithm
+
+
+def insert_per_reply(replies):
+    """
+    Records the samples by calling insert_flow_stats_reply for every reply
+    """
+    algorithm = MonitoringAlgorithm(App(len(replies[0])))
+    for reply in replies:
+        algorithm.insert_flow_stats_reply(reply)
+    return algorithm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=200,
+                        help="Number of samples per flow")
+    args = parser.parse_args()
+
+    replies = generate_replies(args.flows, args.samples)
+    total = args.flows * args.samples
+    print("{} flows, {} samples".format(args.flows, total))
+
+    for benchmark in [insert_dicts, insert_per_sample, insert_per_reply]:
+        gc.collect()
+        start = time.time()
+        result = benchmark(replies)
+        elapsed = time.time() - start
+        del result
+
+        gc.collect()
+        tracemalloc.start()
+        result = benchmark(replies)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+
+        print("{:<18} {:6.3f}s {:6.2f}us/sample {:7.1f} bytes/sample".format(
+            benchmark.__name__,
+            elapsed,
+            elapsed / total * 1000000,
+            retained / float(total)
+        ))
+
+
+if __name__ == "__main__":
+    main()
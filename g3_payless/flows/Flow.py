@@ -6,6 +6,18 @@ class Flow(object):
     Class that eases keeping track of flows
     """
 
+    __slots__ = (
+        "flow_id",
+        "switch_id",
+        "match",
+        "actions",
+        "priority",
+        "match_key",
+        "src_ipv4",
+        "dst_ipv4",
+        "ipv4_key"
+    )
+
     def __init__(self, flow_id, switch_id, match, actions, priority):
         """
         Initializes the flow object
@@ -26,52 +38,50 @@ class Flow(object):
         self.actions = actions
         self.priority = priority
 
-    @property
-    def oxm_fields(self):
+        # The match is parsed once, since it can't change after installation
+        self.match_key = Flow.parse_match(match)
+        oxm_fields = dict(self.match_key)
+        self.src_ipv4 = oxm_fields.get("ipv4_src")
+        self.dst_ipv4 = oxm_fields.get("ipv4_dst")
+        # Identifies this flow by its switch and its IPv4 source and
+        # destination, None if it doesn't match on IPv4
+        self.ipv4_key = Flow.ipv4_key_for(switch_id, self.match_key)
+
+    @staticmethod
+    def parse_match(match):
         """
-        :return: The OXM fields of the match
-        :rtype: dict
+        Parses the OXM fields of a match into an immutable, hashable key
+        :param match: The match to parse
+        :type match: OFPMatch
+        :return: Sorted tuples of the field name and a (value, mask) tuple
+        :rtype: tuple
         """
         oxm_fields = [
             x["OXMTlv"] for x in
-            self.match.to_jsondict()["OFPMatch"]["oxm_fields"]
+            match.to_jsondict()["OFPMatch"]["oxm_fields"]
         ]
-        oxm_data = {
-            val["field"]: (val["value"], val["mask"]) for val in oxm_fields
-        }
-        return oxm_data
-
-    @property
-    def src_ipv4(self):
-        """
-        :return: The source IPv4 address, if applicable (else None)
-        :rtype: tuple
-        """
-        return self.oxm_fields.get("ipv4_src")
-
-    @property
-    def dst_ipv4(self):
-        """
-        :return: The destination IPv4 address, if applicable (else None)
-        :rtype: tuple
-        """
-        return self.oxm_fields.get("ipv4_dst")
+        return tuple(sorted(
+            (val["field"], (val["value"], val["mask"])) for val in oxm_fields
+        ))
 
-    def is_ipv4_match_equal(self, switch_id, match):
+    @staticmethod
+    def ipv4_key_for(switch_id, match_key):
         """
-        Checks if a given match is the same match as this one in regards to
-        IPv4 source and destination
-        :param switch_id: The ID of the switch of the match to check
+        Generates the key identifying a flow by its switch and its IPv4
+        source and destination
+        :param switch_id: The ID of the switch
         :type switch_id: int
-        :param match: The match to check
-        :type match: OFPMatch
-        :return: True if equal, False if not equal
-        :rtype: bool
+        :param match_key: The parsed match, see parse_match
+        :type match_key: tuple
+        :return: The key, or None if the match doesn't match on IPv4
+        :rtype: tuple
         """
-        other_flow = Flow(0, switch_id, match, [], 0)
-        return switch_id == self.switch_id and \
-            self.src_ipv4 == other_flow.src_ipv4 and \
-            self.dst_ipv4 == other_flow.dst_ipv4
+        oxm_fields = dict(match_key)
+        ipv4_src = oxm_fields.get("ipv4_src")
+        ipv4_dst = oxm_fields.get("ipv4_dst")
+        if ipv4_src is None and ipv4_dst is None:
+            return None
+        return switch_id, ipv4_src, ipv4_dst
 
     def __json__(self):
         """
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+
+class FlowsView(Mapping):
+    """
+    Read-only view that merges several flow dictionaries without copying them.
+    Changes to the underlying dictionaries are reflected by the view.
+    """
+
+    def __init__(self, *flow_dicts):
+        """
+        Initializes the view
+        :param flow_dicts: The dictionaries mapping flow IDs to flows.
+                           If a flow ID is contained in more than one
+                           dictionary, the last one takes precedence
+        :type flow_dicts: list
+        """
+        self.flow_dicts = list(reversed(flow_dicts))
+
+    def __getitem__(self, flow_id):
+        """
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :return: The flow
+        :rtype: Flow
+        """
+        for flow_dict in self.flow_dicts:
+            if flow_id in flow_dict:
+                return flow_dict[flow_id]
+        raise KeyError(flow_id)
+
+    def __contains__(self, flow_id):
+        """
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :return: Whether or not the flow is part of this view
+        :rtype: bool
+        """
+        return any(flow_id in flow_dict for flow_dict in self.flow_dicts)
+
+    def __iter__(self):
+        """
+        Iterates over the flow IDs. The keys of each dictionary are
+        snapshotted, so the dictionaries may be modified while iterating
+        :return: The flow IDs
+        """
+        seen = set()
+        for flow_dict in self.flow_dicts:
+            for flow_id in list(flow_dict):
+                if flow_id not in seen:
+                    seen.add(flow_id)
+                    yield flow_id
+
+    def __len__(self):
+        """
+        :return: The number of flows
+        :rtype: int
+        """
+        return sum(1 for _ in self)
@@ -2,13 +2,19 @@
 import os
 import json
 import time
-from threading import Thread
+from threading import Thread, Event, Lock
+from eventlet import tpool
+from ryu.lib import hub
 from ryu.controller.handler import set_ev_cls, MAIN_DISPATCHER
 # noinspection PyUnresolvedReferences
 from ryu.controller.ofp_event import EventOFPFlowStatsReply, EventOFPPacketIn,\
     EventOFPFlowRemoved, EventOFPSwitchFeatures
 from g3_payless.framework.RyuWrapper import RyuWrapper
 from g3_payless.monitoring.MonitoringAlgorithm import MonitoringAlgorithm
+from g3_payless.statistics.TimeSeries import TimeSeries
+from g3_payless.statistics.StatisticsLogWriter import StatisticsLogWriter
+from g3_payless.statistics.ColumnarStatisticsWriter import \
+    ColumnarStatisticsWriter
 
 
 class MonitoringFramework(RyuWrapper):
@@ -22,6 +28,47 @@ class MonitoringFramework(RyuWrapper):
     Specifies where to store the statistics
     """
 
+    STATS_FORMAT = "json"
+    """
+    The format in which statistics are stored:
+        * json: The statistics file is rewritten periodically
+        * log: New samples are periodically appended to a log in the
+               directory STATS_FILE.log, see StatisticsLogWriter
+        * columnar: New samples are periodically appended to binary files
+                    in the directory STATS_FILE.columnar,
+                    see ColumnarStatisticsWriter
+    """
+
+    STATISTICS_RETENTION = 3600
+    """
+    The number of samples per flow and overhead datapoints that are kept at
+    full resolution
+    """
+
+    STATISTICS_DOWNSAMPLING = 10
+    """
+    The number of samples that are merged into one once they are older than
+    the retention allows. 0 discards old samples instead
+    """
+
+    STATISTICS_ARCHIVE_RETENTION = 3600
+    """
+    The number of downsampled samples per flow and overhead datapoints to keep
+    """
+
+    ARCHIVE_REMOVED_FLOWS = True
+    """
+    If True, removed flows and their statistics are evicted from memory once
+    their final statistics have been written. For JSON statistics, they are
+    moved into an archive file next to the statistics file
+    """
+
+    COOPERATIVE = False
+    """
+    If True, all background tasks (polling, overhead tracking and writing
+    statistics) run as greenthreads on Ryu's hub instead of OS threads
+    """
+
     def define_algorithm(self):
         """
         Specifies the MonitoringAlgorithm to use
@@ -32,31 +79,118 @@ class MonitoringFramework(RyuWrapper):
 
     def __init__(self, *args, **kwargs):
         """
-        Initializes the scheduler and starts the background thread
+        Initializes the scheduler
         :param args: Positional Arguments
         :type args: list
         :param kwargs: Keyword Arguments
         :type kwargs: dict
         """
         super(MonitoringFramework, self).__init__(*args, **kwargs)
-        self.overhead_datapoints = {}
+        self.overhead_datapoints = TimeSeries(
+            [
+                ("timestamp", "d", TimeSeries.LAST),
+                ("overhead", "l", TimeSeries.LAST)
+            ],
+            self.STATISTICS_RETENTION,
+            self.STATISTICS_DOWNSAMPLING,
+            self.STATISTICS_ARCHIVE_RETENTION
+        )
+        self.overhead_lock = Lock()
         self.algorithm = self.define_algorithm()
+        self.add_flow_listener(self.algorithm)
         print("Using algorithm: {}".format(self.algorithm))
-        self.threads = []
+        self.background_tasks = set()
+        self.statistics_task = None
+        self.stopped = self.create_event()
+
+    def start(self):
+        """
+        Starts the Ryu event loop as well as the background tasks
+        :return: None
+        """
+        super(MonitoringFramework, self).start()
         self.start_background_threads()
 
+    def stop(self):
+        """
+        Stops the background tasks and the Ryu app.
+        The statistics are written one last time, after which the statistics
+        writer is closed. Apart from that, only greenthreads can be stopped,
+        background OS threads keep running until the process exits.
+        :return: None
+        """
+        self.stopped.set()
+        if self.COOPERATIVE:
+            for task in list(self.background_tasks):
+                if task is not self.statistics_task:
+                    hub.kill(task)
+        if self.statistics_task is not None:
+            if self.COOPERATIVE:
+                hub.joinall([self.statistics_task])
+            else:
+                self.statistics_task.join()
+        super(MonitoringFramework, self).stop()
+
     def start_background_threads(self):
         """
         Starts all background threads
         :return: None
         """
-        self.threads = [
-            Thread(target=self.algorithm.background),
-            Thread(target=self.write_statistics),
-            Thread(target=self.track_overhead)
-        ]
-        for thread in self.threads:
-            thread.start()
+        for target in [
+            self.algorithm.background,
+            self.track_overhead
+        ]:
+            self.spawn(target)
+        self.statistics_task = self.spawn(self.write_statistics)
+
+    def spawn(self, target, *args):
+        """
+        Starts a background task. Depending on the COOPERATIVE setting, the
+        task is either started as a greenthread on Ryu's hub or as an
+        OS thread. Running tasks are kept track of in background_tasks.
+        :param target: The function to run
+        :type target: callable
+        :param args: The arguments to pass to the function
+        :type args: list
+        :return: The greenthread or thread
+        """
+        def run():
+            try:
+                target(*args)
+            finally:
+                self.background_tasks.discard(task)
+
+        if self.COOPERATIVE:
+            task = hub.spawn(run)
+            self.background_tasks.add(task)
+        else:
+            task = Thread(target=run)
+            self.background_tasks.add(task)
+            task.start()
+        return task
+
+    def sleep(self, seconds):
+        """
+        Pauses the current background task, yielding to the other tasks
+        if running cooperatively
+        :param seconds: The time to sleep in seconds
+        :type seconds: float
+        :return: None
+        """
+        if self.COOPERATIVE:
+            hub.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def create_event(self):
+        """
+        Creates an event that can be used to wake up a background task
+        :return: An event supporting set(), clear() and wait(timeout)
+        """
+        if self.COOPERATIVE:
+            return hub.Event()
+        else:
+            return Event()
 
     def track_overhead(self):
         """
@@ -66,8 +200,11 @@ class MonitoringFramework(RyuWrapper):
         """
         while True:
             timestamp = time.time()
-            self.overhead_datapoints[timestamp] = self.overhead_counter
-            time.sleep(1)
+            with self.overhead_lock:
+                self.overhead_datapoints.append(
+                    timestamp, self.overhead_counter
+                )
+            self.sleep(1)
 
     @set_ev_cls(EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _handle_flow_stats_reply(self, event):
@@ -80,13 +217,14 @@ class MonitoringFramework(RyuWrapper):
         """
         self.logger.debug("[S{}] Handling FlowStatsReply"
                           .format(event.msg.datapath.id))
-        self.handle_flow_stats_reply(event)
         self.algorithm.handle_flow_statistics_reply(event)
+        self.handle_flow_stats_reply(event)
 
     def handle_flow_stats_reply(self, event):
         """
         This method may be overridden by child classes to easily add additional
-        behaviour to the handling of FlowStatsReply messages
+        behaviour to the handling of FlowStatsReply messages.
+        It is called after the statistics of the reply have been recorded
         :param event: The FlowStatsReply event
         :type event: EventOFPFlowStatsReply
         :return: None
@@ -145,25 +283,227 @@ class MonitoringFramework(RyuWrapper):
         """
         pass
 
+    def execute_blocking(self, function, *args):
+        """
+        Runs a function that doesn't yield to other tasks, like the
+        serialization of statistics. When running cooperatively, the function
+        is executed in an OS thread of eventlet's thread pool, so that Ryu's
+        event loop keeps handling events in the meantime
+        :param function: The function to run
+        :type function: callable
+        :param args: The arguments to pass to the function
+        :type args: list
+        :return: The return value of the function
+        """
+        if self.COOPERATIVE:
+            return tpool.execute(function, *args)
+        return function(*args)
+
+    def snapshot_statistics(self, flow_cursors=None, overhead_cursor=None):
+        """
+        Creates copies of the statistics, the overhead datapoints and the
+        flows that are not affected by later changes, so they can be
+        serialized while the controller keeps running.
+        If cursors are given, only the samples appended after them are
+        copied, see FlowStatistics.snapshot and TimeSeries.tail_snapshot
+        :param flow_cursors: The cursors of the flow statistics in the
+                             following format:
+                                {flow_id: appended}
+        :type flow_cursors: dict
+        :param overhead_cursor: The cursor of the overhead datapoints
+        :type overhead_cursor: int
+        :return: A tuple consisting of:
+                    * The flow statistics
+                    * The overhead datapoints
+                    * The flows in the following format:
+                        {flow_id: Flow}
+        :rtype: tuple
+        """
+        statistics = self.algorithm.statistics.snapshot(flow_cursors)
+        with self.overhead_lock:
+            if overhead_cursor is None:
+                overhead_datapoints = self.overhead_datapoints.snapshot()
+            else:
+                overhead_datapoints = \
+                    self.overhead_datapoints.tail_snapshot(overhead_cursor)
+        flows = dict(self.all_flows.items())
+        return statistics, overhead_datapoints, flows
+
     def write_statistics(self):
         """
-        Periodically writes statistics to the statistics file
+        Periodically writes statistics in the configured format
         :return: None
         """
-        while True:
-            time.sleep(10)
-            stats = {
-                "flow_stats": self.algorithm.statistics,
-                "overhead": self.overhead_datapoints,
-                "flow_info": {
-                    x: y.__json__()
-                    for x, y in self.all_flows.items()
-                },
-                "algorithm": self.algorithm.name()
-            }
-            directory = os.path.dirname(self.STATS_FILE)
-            if not os.path.isdir(directory):
-                os.makedirs(directory)
-            with open(self.STATS_FILE, "w") as f:
-                json.dump(stats, f, indent=4, sort_keys=True)
-                self.logger.info("Wrote Stats to file")
+        algorithm_name = self.algorithm.name()
+        if self.STATS_FORMAT == "log":
+            self.write_statistics_incrementally(StatisticsLogWriter(
+                self.STATS_FILE + ".log", algorithm_name
+            ))
+        elif self.STATS_FORMAT == "columnar":
+            self.write_statistics_incrementally(ColumnarStatisticsWriter(
+                self.STATS_FILE + ".columnar", algorithm_name
+            ))
+        else:
+            self.write_statistics_json()
+
+    def write_statistics_incrementally(self, writer):
+        """
+        Periodically hands new statistics to a writer that appends them to
+        its files. Only the samples past the writer's cursors are copied.
+        Removed flows are stored once written, so they are evicted
+        from memory afterwards if ARCHIVE_REMOVED_FLOWS is set.
+        Once the app is stopped, the statistics are written a last time and
+        the writer is closed
+        :param writer: The writer, see StatisticsLogWriter and
+                       ColumnarStatisticsWriter
+        :type writer: object
+        :return: None
+        """
+        try:
+            stopped = False
+            while not stopped:
+                stopped = self.stopped.wait(10)
+
+                to_archive = list(self.removed_flows.keys())
+                snapshot = self.snapshot_statistics(
+                    writer.flow_cursors, writer.overhead_cursor
+                )
+                record_count = self.execute_blocking(writer.write, *snapshot)
+                self.logger.info("Appended {} records to statistics"
+                                 .format(record_count))
+
+                if self.ARCHIVE_REMOVED_FLOWS:
+                    # The cursors now cover exactly the written samples
+                    writer.forget(self.evict_removed_flows(
+                        to_archive, writer.flow_cursors
+                    ))
+        finally:
+            writer.close()
+
+    def write_statistics_json(self):
+        """
+        Periodically writes statistics to the statistics file until the app
+        is stopped
+        :return: None
+        """
+        archive_file = self.STATS_FILE + ".flows"
+        if os.path.isfile(archive_file):
+            os.remove(archive_file)
+
+        stopped = False
+        while not stopped:
+            stopped = self.stopped.wait(10)
+
+            # Final statistics are recorded before a flow gets removed, so
+            # all currently removed flows are complete after this write
+            to_archive = list(self.removed_flows.keys())
+
+            snapshot = self.snapshot_statistics()
+            self.execute_blocking(self.dump_statistics, *snapshot)
+            self.logger.info("Wrote Stats to file")
+
+            if self.ARCHIVE_REMOVED_FLOWS:
+                statistics, _, flows = snapshot
+                written = {
+                    flow_id: statistics[flow_id].appended
+                    for flow_id in to_archive if flow_id in statistics
+                }
+                self.execute_blocking(
+                    self.archive_flows,
+                    archive_file,
+                    self.evict_removed_flows(to_archive, written),
+                    statistics,
+                    flows
+                )
+
+    # noinspection PyMethodMayBeStatic
+    def archive_flows(self, archive_file, flow_ids, statistics, flows):
+        """
+        Appends the JSON representations and the statistics of flows to an
+        archive file, one flow per line
+        :param archive_file: The path to the archive file
+        :type archive_file: str
+        :param flow_ids: The IDs of the flows to archive
+        :type flow_ids: list
+        :param statistics: The flow statistics
+        :type statistics: FlowStatistics
+        :param flows: The flows in the following format:
+                        {flow_id: Flow}
+        :type flows: dict
+        :return: None
+        """
+        with open(archive_file, "a") as f:
+            for flow_id in flow_ids:
+                flow = flows.get(flow_id)
+                if flow is None:
+                    continue
+                flow_stats = {}
+                if flow_id in statistics:
+                    flow_stats = statistics[flow_id].__json__()
+                f.write(json.dumps({
+                    "flow_info": flow.__json__(),
+                    "flow_stats": flow_stats
+                }) + "\n")
+
+    def evict_removed_flows(self, flow_ids, cursors):
+        """
+        Evicts removed flows and their statistics from memory once their
+        final statistics have been persisted. Flows that received samples
+        after the persisted ones are kept until the next write, so these
+        samples aren't lost
+        :param flow_ids: The IDs of the removed flows
+        :type flow_ids: list
+        :param cursors: The number of persisted samples per flow in the
+                        following format:
+                            {flow_id: appended}
+        :type cursors: dict
+        :return: The IDs of the evicted flows
+        :rtype: list
+        """
+        evicted = []
+        for flow_id in flow_ids:
+            if flow_id not in self.removed_flows:
+                continue
+            if self.algorithm.remove_flow_statistics(
+                    flow_id, cursors.get(flow_id, 0)
+            ):
+                self.removed_flows.pop(flow_id, None)
+                evicted.append(flow_id)
+        return evicted
+
+    def dump_statistics(self, statistics, overhead_datapoints, flows):
+        """
+        Writes a snapshot of the statistics to the statistics file.
+        The statistics are written to a temporary file first, which then
+        atomically replaces the statistics file. Archived flows are not
+        part of the statistics file, readers merge them from the archive
+        file, see read_stats
+        :param statistics: The flow statistics
+        :type statistics: FlowStatistics
+        :param overhead_datapoints: The overhead datapoints
+        :type overhead_datapoints: TimeSeries
+        :param flows: The flows in the following format:
+                        {flow_id: Flow}
+        :type flows: dict
+        :return: None
+        """
+        flow_info = {
+            flow_id: flow.__json__() for flow_id, flow in flows.items()
+        }
+
+        stats = {
+            "flow_stats": statistics.__json__(),
+            "overhead": overhead_datapoints.__json__(),
+            "flow_info": flow_info,
+            "algorithm": self.algorithm.name()
+        }
+        directory = os.path.dirname(self.STATS_FILE)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_file = self.STATS_FILE + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump(stats, f, indent=4, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_file, self.STATS_FILE)
@@ -1,17 +1,28 @@
 # -*- coding: utf-8 -*-
 import logging
+from itertools import count
+from threading import Lock
 from ryu.base.app_manager import RyuApp
 from ryu.controller.controller import Datapath
-from ryu.controller.handler import set_ev_cls, CONFIG_DISPATCHER
+from ryu.controller.handler import set_ev_cls, CONFIG_DISPATCHER, \
+    DEAD_DISPATCHER
 # noinspection PyUnresolvedReferences
-from ryu.controller.ofp_event import EventOFPSwitchFeatures
+from ryu.controller.ofp_event import EventOFPSwitchFeatures, \
+    EventOFPStateChange
 from ryu.ofproto.ofproto_v1_3_parser import OFPMatch, OFPFlowMod, \
     OFPInstructionActions, OFPFlowStatsRequest, OFPActionOutput, \
     OFPSetConfig, OFPPacketOut
 from ryu.ofproto.ofproto_v1_3 import OFPIT_APPLY_ACTIONS, \
-    OFPFF_SEND_FLOW_REM, OFPP_CONTROLLER, OFPC_FRAG_NORMAL, OFPP_FLOOD, \
-    OFP_NO_BUFFER
+    OFPFF_SEND_FLOW_REM, OFPFF_RESET_COUNTS, OFPP_CONTROLLER, \
+    OFPC_FRAG_NORMAL, OFPP_FLOOD, OFP_NO_BUFFER, OFPTT_ALL
 from g3_payless.flows.Flow import Flow
+from g3_payless.flows.FlowsView import FlowsView
+
+
+COOKIE_BITS = 0xffffffffffffffff
+"""
+Bit mask covering the 64 bits of an OpenFlow cookie
+"""
 
 
 class RyuWrapper(RyuApp):
@@ -20,6 +31,18 @@ class RyuWrapper(RyuApp):
     life improvements
     """
 
+    MAX_COOKIE_FILTERS = 4
+    """
+    The maximum number of flow statistics requests sent to a switch for a
+    batch of due flows
+    """
+
+    MAX_TARGETED_FLOWS = 256
+    """
+    The number of due flows on a switch above which the whole flow table
+    is requested instead
+    """
+
     def __init__(self, *args, **kwargs):
         """
         Initializes the ryu App.
@@ -31,20 +54,64 @@ class RyuWrapper(RyuApp):
         super(RyuWrapper, self).__init__(*args, **kwargs)
         self.active_flows = {}
         self.removed_flows = {}
+        self.ipv4_flows = {}
+        self.flow_id_counter = count()
+        self.flow_id_lock = Lock()
         self.switches = {}
+        self.flow_listeners = []
         self.overhead_counter = 0
         self.logger = logging.getLogger(__name__)
 
     @property
     def all_flows(self):
         """
-        :return: All active and removed flows
-        :rtype: dict
+        :return: A read-only view of all active and removed flows that are
+                 still kept in memory
+        :rtype: FlowsView
         """
-        all_flows = {}
-        all_flows.update(self.active_flows)
-        all_flows.update(self.removed_flows)
-        return all_flows
+        return FlowsView(self.active_flows, self.removed_flows)
+
+    def allocate_flow_id(self):
+        """
+        Allocates a new flow ID. Flow IDs are handed out in increasing order
+        and are never reused, not even after a flow was removed, so that
+        cookies stay unique for the statistics of removed flows.
+        :return: The new flow ID
+        :rtype: int
+        """
+        self.flow_id_lock.acquire()
+        flow_id = next(self.flow_id_counter)
+        self.flow_id_lock.release()
+        return flow_id
+
+    def get_ipv4_flow(self, switch_id, match):
+        """
+        Looks up an active flow that has the same IPv4 source and destination
+        as a match on a switch
+        :param switch_id: The ID of the switch
+        :type switch_id: int
+        :param match: The match to look up
+        :type match: OFPMatch
+        :return: The active flow, or None if no such flow exists
+        :rtype: Flow
+        """
+        key = Flow.ipv4_key_for(switch_id, Flow.parse_match(match))
+        flow_id = self.ipv4_flows.get(key)
+        if flow_id is None:
+            return None
+        return self.active_flows.get(flow_id)
+
+    def add_flow_listener(self, listener):
+        """
+        Registers an object that gets notified whenever a flow is programmed
+        or removed. Listeners have to implement the methods
+        handle_flow_programmed(flow) and handle_flow_deleted(flow)
+        :param listener: The listener to register
+        :type listener: object
+        :return: None
+        :rtype: None
+        """
+        self.flow_listeners.append(listener)
 
     @set_ev_cls(EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def _handle_switch_features(self, event):
@@ -86,6 +153,32 @@ class RyuWrapper(RyuApp):
         """
         pass
 
+    @set_ev_cls(EventOFPStateChange, DEAD_DISPATCHER)
+    def _handle_switch_disconnected(self, event):
+        """
+        Notifies child classes whenever a switch disconnects
+        :param event: The StateChange event
+        :type event: EventOFPStateChange
+        :return: None
+        :rtype: None
+        """
+        datapath = event.datapath
+        if datapath.id is None:  # Disconnected before the handshake
+            return
+        self.logger.debug("[S{}] Disconnected".format(datapath.id))
+        self.handle_switch_disconnected(event)
+
+    def handle_switch_disconnected(self, event):
+        """
+        Can be used by child classes to clean up the state of a switch
+        that disconnected
+        :param event: The StateChange event
+        :type event: EventOFPStateChange
+        :return: None
+        :rtype: None
+        """
+        pass
+
     def program_flow(
             self,
             datapath,
@@ -93,7 +186,8 @@ class RyuWrapper(RyuApp):
             actions,
             priority=0,
             hard_timeout=600,
-            idle_timeout=60
+            idle_timeout=60,
+            reset_counts=False
     ):
         """
         Install a new flow rule, while automatically adding the
@@ -111,15 +205,23 @@ class RyuWrapper(RyuApp):
         :type hard_timeout: int
         :param idle_timeout: The idle timeout of the flow rule
         :type idle_timeout: int
+        :param reset_counts: Whether or not to reset the counters if the
+                             flow rule replaces an existing one with the same
+                             match and priority. Otherwise the switch copies
+                             them from the replaced flow rule
+        :type reset_counts: bool
         :return: The flow ID of the installed flow rule
         :rtype: int
         """
-        if len(self.active_flows) == 0:
-            flow_id = 0
-        else:
-            flow_id = max(self.active_flows.keys()) + 1
+        flow_id = self.allocate_flow_id()
         flow_obj = Flow(flow_id, datapath.id, match, actions, priority)
         self.active_flows[flow_id] = flow_obj
+        if flow_obj.ipv4_key is not None:
+            self.ipv4_flows[flow_obj.ipv4_key] = flow_id
+
+        flags = OFPFF_SEND_FLOW_REM
+        if reset_counts:
+            flags |= OFPFF_RESET_COUNTS
 
         flowmod = OFPFlowMod(
             datapath,
@@ -134,27 +236,151 @@ class RyuWrapper(RyuApp):
             hard_timeout=hard_timeout,
             idle_timeout=idle_timeout,
             cookie=flow_id,
-            flags=OFPFF_SEND_FLOW_REM
+            flags=flags
         )
         datapath.send_msg(flowmod)
         self.logger.info("[S{}] Install Flow Rule {}: {}"
                          .format(datapath.id, flow_id, match))
+        for listener in self.flow_listeners:
+            listener.handle_flow_programmed(flow_obj)
         return flow_id
 
-    def send_flowstats_request(self, switch_id):
+    def send_flowstats_request(
+            self,
+            switch_id,
+            cookie=0,
+            cookie_mask=0,
+            table_id=OFPTT_ALL,
+            match=None
+    ):
         """
-        Send a request for flow statistics to a switch
+        Send a request for flow statistics to a switch.
+        By default, the statistics of all flows on the switch are requested.
         :param switch_id: The ID of the switch
         :type switch_id: int
+        :param cookie: Only request flows whose cookie matches this cookie in
+                       the bits set in cookie_mask
+        :type cookie: int
+        :param cookie_mask: The cookie bits to match, 0 matches all flows
+        :type cookie_mask: int
+        :param table_id: The table from which to request flows
+        :type table_id: int
+        :param match: Only request flows matching this match
+        :type match: OFPMatch
         :return: None
         :rtype: None
         """
-        self.logger.debug("Requesting flowstats from {}".format(switch_id))
+        self.logger.debug("Requesting flowstats from {} (cookie={:#x}/{:#x})"
+                          .format(switch_id, cookie, cookie_mask))
         switch = self.switches[switch_id]
-        req = OFPFlowStatsRequest(switch)
+        req = OFPFlowStatsRequest(
+            switch,
+            table_id=table_id,
+            cookie=cookie,
+            cookie_mask=cookie_mask,
+            match=match
+        )
         switch.send_msg(req)
         self.overhead_counter += 1
 
+    def send_flowstats_request_for_flows(self, switch_id, flow_ids):
+        """
+        Sends requests for flow statistics to a switch that are restricted
+        to the cookies of the given flows, see calculate_cookie_filters
+        :param switch_id: The ID of the switch
+        :type switch_id: int
+        :param flow_ids: The IDs of the flows to request
+        :type flow_ids: list
+        :return: None
+        :rtype: None
+        """
+        for cookie, cookie_mask in self.calculate_cookie_filters(flow_ids):
+            self.send_flowstats_request(switch_id, cookie, cookie_mask)
+
+    def calculate_cookie_filters(self, flow_ids):
+        """
+        Calculates the cookie/cookie_mask pairs with which to request the
+        statistics of the given flows.
+        Up to MAX_COOKIE_FILTERS flows are requested by their exact cookies.
+        Otherwise, the sorted flow IDs are split at their largest gaps into
+        MAX_COOKIE_FILTERS groups, each of which is requested by the aligned
+        cookie range of its longest common bit prefix, so that flows whose
+        IDs lie far apart don't widen the range of the other flows.
+        Above MAX_TARGETED_FLOWS flows, the whole flow table is requested.
+        :param flow_ids: The flow IDs to match
+        :type flow_ids: list
+        :return: The cookies and cookie masks as tuples
+        :rtype: list
+        """
+        flow_ids = sorted(set(flow_ids))
+        if len(flow_ids) > self.MAX_TARGETED_FLOWS:
+            return [(0, 0)]
+        if len(flow_ids) <= self.MAX_COOKIE_FILTERS:
+            return [(flow_id, COOKIE_BITS) for flow_id in flow_ids]
+
+        largest_gaps = sorted(
+            range(1, len(flow_ids)),
+            key=lambda index: flow_ids[index] - flow_ids[index - 1],
+            reverse=True
+        )[:self.MAX_COOKIE_FILTERS - 1]
+        boundaries = [0] + sorted(largest_gaps) + [len(flow_ids)]
+
+        filters = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            cookie, cookie_mask = \
+                self.calculate_cookie_filter(flow_ids[start:end])
+            # Aligned ranges are either disjoint or nested, nested ranges
+            # would lead to flows being reported twice
+            if len(filters) > 0 and self.cookie_filter_contains(
+                    filters[-1], cookie, cookie_mask
+            ):
+                continue
+            while len(filters) > 0 and self.cookie_filter_contains(
+                    (cookie, cookie_mask), *filters[-1]
+            ):
+                filters.pop()
+            filters.append((cookie, cookie_mask))
+        return filters
+
+    @staticmethod
+    def cookie_filter_contains(cookie_filter, cookie, cookie_mask):
+        """
+        Checks whether an aligned cookie range lies within another one
+        :param cookie_filter: The cookie and cookie mask of the outer range
+        :type cookie_filter: tuple
+        :param cookie: The cookie of the inner range
+        :type cookie: int
+        :param cookie_mask: The cookie mask of the inner range
+        :type cookie_mask: int
+        :return: True if every cookie of the inner range is in the outer one
+        :rtype: bool
+        """
+        outer_cookie, outer_mask = cookie_filter
+        return cookie_mask & outer_mask == outer_mask and \
+            cookie & outer_mask == outer_cookie
+
+    # noinspection PyMethodMayBeStatic
+    def calculate_cookie_filter(self, flow_ids):
+        """
+        Calculates the narrowest cookie/cookie_mask pair that matches all
+        of the given flow IDs, i.e. their longest common bit prefix
+        :param flow_ids: The flow IDs to match
+        :type flow_ids: list
+        :return: The cookie and the cookie mask
+        :rtype: tuple
+        """
+        flow_ids = list(flow_ids)
+        if len(flow_ids) == 0:
+            return 0, 0
+
+        first = flow_ids[0]
+        differing = 0
+        for flow_id in flow_ids:
+            differing |= first ^ flow_id
+
+        cookie_mask = ~((1 << differing.bit_length()) - 1) & COOKIE_BITS
+        return first & cookie_mask, cookie_mask
+
     # noinspection PyMethodMayBeStatic
     def send_pkt(self, datapath, data, port=OFPP_FLOOD):
         """
@@ -190,3 +416,7 @@ class RyuWrapper(RyuApp):
             self.logger.info("Removing Flow {}".format(flow_id))
             flow = self.active_flows.pop(flow_id)
             self.removed_flows[flow_id] = flow
+            if self.ipv4_flows.get(flow.ipv4_key) == flow_id:
+                self.ipv4_flows.pop(flow.ipv4_key)
+            for listener in self.flow_listeners:
+                listener.handle_flow_deleted(flow)
@@ -5,6 +5,9 @@ import logging
 from ryu.controller.ofp_event import EventOFPFlowStatsReply, EventOFPPacketIn,\
     EventOFPFlowRemoved
 from g3_payless.framework.RyuWrapper import RyuWrapper
+from g3_payless.flows.Flow import Flow
+from g3_payless.statistics.FlowStatistics import FlowStatistics
+from g3_payless.statistics.FlowState import FlowState
 
 
 class MonitoringAlgorithm(object):
@@ -21,7 +24,11 @@ class MonitoringAlgorithm(object):
         :type app: RyuWrapper
         """
         self.app = app
-        self.statistics = {}
+        self.statistics = FlowStatistics(
+            app.STATISTICS_RETENTION,
+            app.STATISTICS_DOWNSAMPLING,
+            app.STATISTICS_ARCHIVE_RETENTION
+        )
         self.flow_states = {}
         self.logger = logging.getLogger(__name__)
 
@@ -74,6 +81,28 @@ class MonitoringAlgorithm(object):
         """
         raise NotImplementedError()
 
+    def handle_flow_programmed(self, flow):
+        """
+        Called whenever the app installs a new flow rule.
+        May be overridden by algorithms that keep track of flows
+        :param flow: The newly programmed flow
+        :type flow: Flow
+        :return: None
+        :rtype: None
+        """
+        pass
+
+    def handle_flow_deleted(self, flow):
+        """
+        Called whenever the app moves a flow into its removed flows.
+        May be overridden by algorithms that keep track of flows
+        :param flow: The removed flow
+        :type flow: Flow
+        :return: None
+        :rtype: None
+        """
+        pass
+
     def insert_flow_stats(self, flow_id, total_bytes, duration_msec):
         """
         Stores collected flow statistics in self.statistics
@@ -87,35 +116,127 @@ class MonitoringAlgorithm(object):
         :rtype: tuple
         """
 
-        if flow_id not in self.flow_states:
-            self.flow_states[flow_id] = {
-                "total_bytes": 0,
-                "duration": 0
-            }
-        current = self.flow_states[flow_id]
+        current = self.flow_states.get(flow_id)
+        if current is None:
+            # Late replies for flows that were already evicted from memory
+            # would otherwise be recorded as new flows
+            if flow_id not in self.app.all_flows:
+                return 0, 0
+            current = FlowState()
+            self.flow_states[flow_id] = current
 
-        bytes_diff = total_bytes - current["total_bytes"]
-        duration_diff = duration_msec - current["duration"]
+        bytes_diff = total_bytes - current.total_bytes
+        duration_diff = duration_msec - current.duration
 
-        self.flow_states[flow_id] = {
-            "total_bytes": total_bytes,
-            "duration": duration_msec
-        }
+        self.statistics.add(
+            flow_id,
+            time.time(),
+            bytes_diff,
+            duration_diff,
+            current.total_bytes,
+            current.duration
+        )
 
-        if flow_id not in self.statistics:
-            self.statistics[flow_id] = {}
-        self.statistics[flow_id][time.time()] = {
-            "bytes": bytes_diff,
-            "duration": duration_diff,
-            "total_bytes": current["total_bytes"],
-            "total_duration": current["duration"]
-        }
+        current.total_bytes = total_bytes
+        current.duration = duration_msec
 
-        self.logger.debug("[F{}] Stats: bytes={}, duration={}"
-                          .format(flow_id, bytes_diff, duration_diff))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[F{}] Stats: bytes={}, duration={}"
+                              .format(flow_id, bytes_diff, duration_diff))
 
         return bytes_diff, duration_diff
 
+    def insert_flow_stats_reply(self, flowstats):
+        """
+        Stores the statistics of all flows of a FlowStatsReply in
+        self.statistics, taking the statistics lock only once
+        :param flowstats: The flow statistics of the reply
+        :type flowstats: list
+        :return: Tuples consisting of the flow ID, the byte count diff and
+                 the duration diff
+        :rtype: list
+        """
+        flow_states = self.flow_states
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        samples = []
+        diffs = []
+        for flow in flowstats:
+            flow_id = flow.cookie
+            current = flow_states.get(flow_id)
+            if current is None:
+                if flow_id not in self.app.all_flows:  # Already evicted
+                    diffs.append((flow_id, 0, 0))
+                    continue
+                current = FlowState()
+                flow_states[flow_id] = current
+
+            duration_msec = self.calculate_duration_msec(flow)
+            bytes_diff = flow.byte_count - current.total_bytes
+            duration_diff = duration_msec - current.duration
+            samples.append((
+                flow_id,
+                bytes_diff,
+                duration_diff,
+                current.total_bytes,
+                current.duration
+            ))
+            diffs.append((flow_id, bytes_diff, duration_diff))
+
+            current.total_bytes = flow.byte_count
+            current.duration = duration_msec
+
+            if debug:
+                self.logger.debug("[F{}] Stats: bytes={}, duration={}"
+                                  .format(flow_id, bytes_diff, duration_diff))
+
+        self.statistics.add_samples(time.time(), samples)
+        return diffs
+
+    def remove_flow_statistics(self, flow_id, cursor=None):
+        """
+        Discards the statistics and the counters of a removed flow once its
+        final statistics have been persisted
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param cursor: If given, nothing is discarded if samples were added
+                       after this number of samples, see
+                       FlowStatistics.remove
+        :type cursor: int
+        :return: Whether or not the statistics were discarded
+        :rtype: bool
+        """
+        if not self.statistics.remove(flow_id, cursor):
+            return False
+        self.flow_states.pop(flow_id, None)
+        return True
+
+    def send_targeted_flowstats_requests(self, flows):
+        """
+        Sends FlowStatsRequests for a batch of due flows.
+        The flows are grouped by switch and each switch is sent a few
+        requests that are restricted to the cookies of its due flows.
+        :param flows: Tuples of flow IDs and switch IDs of the due flows
+        :type flows: list
+        :return: The IDs of the switches that were sent a request
+        :rtype: list
+        """
+        receivers = {}
+        receiver_ids = []
+        for flow_id, switch_id in flows:
+            if switch_id not in receivers:
+                receivers[switch_id] = []
+                receiver_ids.append(switch_id)
+            receivers[switch_id].append(flow_id)
+
+        if len(receiver_ids) > 0:
+            self.logger.info("Sending stat requests to {}"
+                             .format(receiver_ids))
+        for switch_id in receiver_ids:
+            self.app.send_flowstats_request_for_flows(
+                switch_id, receivers[switch_id]
+            )
+        return receiver_ids
+
     # noinspection PyMethodMayBeStatic
     def calculate_duration_msec(self, flowstats):
         """
@@ -129,7 +250,7 @@ class MonitoringAlgorithm(object):
 
         seconds = flowstats.duration_sec
         nanoseconds = flowstats.duration_nsec
-        milliseconds = (seconds * 1000) + (nanoseconds / 1000000)
+        milliseconds = (seconds * 1000) + (nanoseconds // 1000000)
         return milliseconds
 
     def __str__(self):
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
-import time
-from threading import Thread, Lock
+from threading import Lock
 from g3_payless.framework.RyuWrapper import RyuWrapper
+from g3_payless.flows.Flow import Flow
 from g3_payless.monitoring.MonitoringAlgorithm import MonitoringAlgorithm
+from g3_payless.monitoring.ScheduleEntry import ScheduleEntry
 
 
 class PaylessMultiThread(MonitoringAlgorithm):
@@ -51,6 +52,7 @@ class PaylessMultiThread(MonitoringAlgorithm):
         self.delta_2 = delta_2
 
         self.schedule_table = {}
+        self.flow_index = {}
         self.scheduling_threads = {}
         self.schedule_lock = Lock()
 
@@ -73,39 +75,43 @@ class PaylessMultiThread(MonitoringAlgorithm):
         :rtype: None
         """
         self.logger.info("Starting monitoring thread for tau={}".format(tau))
+        tau_seconds = float(tau) / 1000.0
         while True:
-            tau_seconds = float(tau) / 1000.0
-            time.sleep(tau_seconds)
-            flows = self.schedule_table[tau]
-            receiver_ids = [switch_id for switch_id in flows.values()]
-
-            if len(receiver_ids) > 0:
-                self.logger.info("Sending stat requests to {} for tau={}"
-                                 .format(receiver_ids, tau))
+            self.app.sleep(tau_seconds)
+            self.schedule_lock.acquire()
+            due_flows = list(self.schedule_table[tau].items())
+            if len(due_flows) == 0:
+                self.scheduling_threads.pop(tau)
+            self.schedule_lock.release()
 
-            for switch_id in receiver_ids:
-                self.app.send_flowstats_request(switch_id)
+            if len(due_flows) == 0:
+                self.logger.info("Stopping monitoring thread for tau={}"
+                                 .format(tau))
+                return
+            self.send_targeted_flowstats_requests(due_flows)
 
     def background(self):
         """
-        Periodically checks if each tau entry in the scheduling table has
-        its own monitoring thread and if not, starts it.
+        Periodically checks if each non-empty tau entry in the scheduling
+        table has its own monitoring thread and if not, starts it.
+        Monitoring threads stop once their tau entry becomes empty.
         :return: None
         :rtype: None
         """
         while True:
-            time.sleep(1)
-            self.add_missing_flows()
-            for tau in self.schedule_table.keys():
-                if tau not in self.scheduling_threads:
-                    thread = Thread(target=lambda: self.monitor(tau))
-                    thread.start()
-                    self.scheduling_threads[tau] = thread
+            self.app.sleep(1)
+            self.schedule_lock.acquire()
+            for tau, flows in self.schedule_table.items():
+                if len(flows) > 0 and tau not in self.scheduling_threads:
+                    self.scheduling_threads[tau] = \
+                        self.app.spawn(self.monitor, tau)
+            self.schedule_lock.release()
 
     def handle_packet_in(self, event, flow_ids):
         """
         Registers packets that were installed in the PacketIn event in the
-        scheduling table.
+        scheduling table, unless they were already registered when they
+        were programmed.
         :param event: The PacketIn event
         :type event: EventOFPPacketIn
         :param flow_ids: The IDs of the installed flow rules
@@ -120,10 +126,37 @@ class PaylessMultiThread(MonitoringAlgorithm):
         tau = self.tau_start
 
         self.schedule_lock.acquire()
-        if tau not in self.schedule_table:
-            self.schedule_table[tau] = {}
         for flow_id in flow_ids:
-            self.schedule_table[tau][flow_id] = switch_id
+            if flow_id not in self.flow_index:
+                self.schedule_flow(flow_id, switch_id, tau)
+        self.schedule_lock.release()
+
+    def handle_flow_programmed(self, flow):
+        """
+        Adds newly programmed flows (including proactive flows) to the
+        scheduling table.
+        This is necessary to keep it fair towards the periodic polling
+        approach.
+        :param flow: The programmed flow
+        :type flow: Flow
+        :return: None
+        :rtype: None
+        """
+        self.schedule_lock.acquire()
+        if flow.flow_id not in self.flow_index:
+            self.schedule_flow(flow.flow_id, flow.switch_id, self.tau_start)
+        self.schedule_lock.release()
+
+    def handle_flow_deleted(self, flow):
+        """
+        Removes deleted flows from the scheduling table
+        :param flow: The deleted flow
+        :type flow: Flow
+        :return: None
+        :rtype: None
+        """
+        self.schedule_lock.acquire()
+        self.unschedule_flow(flow.flow_id)
         self.schedule_lock.release()
 
     def handle_flow_removed(self, event):
@@ -139,12 +172,6 @@ class PaylessMultiThread(MonitoringAlgorithm):
         self.insert_flow_stats(flow_id, event_byte_count, event_duration)
         self.app.remove_flow(flow_id)
 
-        flow_info = self.get_flow_info(flow_id)
-        if flow_info is not None:
-            self.schedule_lock.acquire()
-            self.schedule_table[flow_info["tau"]].pop(flow_id)
-            self.schedule_lock.release()
-
     def handle_flow_statistics_reply(self, event):
         """
         Handles flow statistics replies.
@@ -153,19 +180,12 @@ class PaylessMultiThread(MonitoringAlgorithm):
         :param event: The FlowStatsReply event
         :return: None
         """
-        for flow in event.msg.body:
-            flow_id = flow.cookie
-            event_byte_count = flow.byte_count
-            event_duration = self.calculate_duration_msec(flow)
-
-            diff_byte_count, diff_duration = self.insert_flow_stats(
-                flow_id, event_byte_count, event_duration
-            )
-
+        diffs = self.insert_flow_stats_reply(event.msg.body)
+        for flow_id, diff_byte_count, _ in diffs:
             flow_info = self.get_flow_info(flow_id)
             if flow_info is None:
-                return
-            tau = flow_info["tau"]
+                continue
+            tau = flow_info.tau
 
             if diff_byte_count < self.delta_1:
                 new_tau = min(tau * self.alpha, self.tau_max)
@@ -175,13 +195,9 @@ class PaylessMultiThread(MonitoringAlgorithm):
                 new_tau = tau
 
             self.schedule_lock.acquire()
-
-            if new_tau not in self.schedule_table:
-                self.schedule_table[new_tau] = {}
-            flow_info["tau"] = new_tau
-            self.schedule_table[tau].pop(flow_id)
-            self.schedule_table[new_tau][flow_id] = flow_info["switch_id"]
-
+            # The flow may have been removed while the reply was processed
+            if flow_id in self.flow_index:
+                self.schedule_flow(flow_id, flow_info.switch_id, new_tau)
             self.schedule_lock.release()
 
     def get_flow_info(self, flow_id):
@@ -190,38 +206,50 @@ class PaylessMultiThread(MonitoringAlgorithm):
         :param flow_id: The ID of the flow
         :type flow_id: int
         :return: The flow info, or None if it's not in the scheduling table
-        :rtype: dict
+        :rtype: ScheduleEntry
         """
-        for tau, flows in self.schedule_table.items():
-            for _flow_id, switch_id in flows.items():
-                if flow_id == _flow_id:
-                    return {"switch_id": switch_id, "tau": tau}
-        return None
+        return self.flow_index.get(flow_id)
 
-    def add_missing_flows(self):
+    def schedule_flow(self, flow_id, switch_id, tau):
         """
-        Makes sure that missing flows (i.e., proactive flows) are also
-        tracked by payless.
-        This is necessary to keep it fair towards the periodic polling
-        approach.
+        Places a flow in the bucket of a tau value, removing it from its
+        previous bucket if it was already scheduled.
+        Keeps the flow index consistent with the schedule table, the caller
+        has to hold the schedule lock.
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param switch_id: The ID of the switch the flow is installed on
+        :type switch_id: int
+        :param tau: The tau value of the bucket
+        :type tau: int
         :return: None
+        :rtype: None
+        """
+        entry = self.flow_index.get(flow_id)
+        if entry is None:
+            entry = ScheduleEntry(switch_id, tau)
+            self.flow_index[flow_id] = entry
+        else:
+            self.schedule_table[entry.tau].pop(flow_id, None)
+            entry.switch_id = switch_id
+            entry.tau = tau
+        if tau not in self.schedule_table:
+            self.schedule_table[tau] = {}
+        self.schedule_table[tau][flow_id] = switch_id
+
+    def unschedule_flow(self, flow_id):
+        """
+        Removes a flow from the schedule table and the flow index.
+        The caller has to hold the schedule lock.
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :return: The previous flow info, or None if it wasn't scheduled
+        :rtype: ScheduleEntry
         """
-        # Make sure that proactive flows are also polled
-        for id_to_check, active_flow in self.app.active_flows.items():
-            included = False
-            for flow_ids in self.schedule_table.values():
-                for flow_id in flow_ids.keys():
-                    if flow_id == id_to_check:
-                        included = True
-            if not included:
-                self.logger.info("Adding missing flow rule {} to "
-                                 "scheduling table".format(id_to_check))
-                self.schedule_lock.acquire()
-                if self.tau_start not in self.schedule_table:
-                    self.schedule_table[self.tau_start] = {}
-                self.schedule_table[self.tau_start][id_to_check] = \
-                    active_flow.switch_id
-                self.schedule_lock.release()
+        flow_info = self.flow_index.pop(flow_id, None)
+        if flow_info is not None:
+            self.schedule_table[flow_info.tau].pop(flow_id, None)
+        return flow_info
 
     def __str__(self):
         """
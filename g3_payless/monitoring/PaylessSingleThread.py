@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
-import time
+import heapq
 from g3_payless.monitoring.PaylessMultiThread import PaylessMultiThread
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
 
 
 class PaylessSingleThread(PaylessMultiThread):
@@ -9,6 +13,19 @@ class PaylessSingleThread(PaylessMultiThread):
     a single background thread
     """
 
+    def __init__(self, *args, **kwargs):
+        """
+        Initializes the algorithm and the deadline queue
+        :param args: Positional Arguments, see PaylessMultiThread
+        :type args: list
+        :param kwargs: Keyword Arguments, see PaylessMultiThread
+        :type kwargs: dict
+        """
+        super(PaylessSingleThread, self).__init__(*args, **kwargs)
+        self.deadlines = []
+        self.scheduled_taus = set()
+        self.wakeup = self.app.create_event()
+
     @classmethod
     def name(cls):
         """
@@ -17,40 +34,84 @@ class PaylessSingleThread(PaylessMultiThread):
         """
         return "payless-single-thread"
 
-    def background(self):
+    def schedule_flow(self, flow_id, switch_id, tau):
         """
-        Periodically sends out FlowStatsRequests to the switches in accordance
-        with the payless adaptive monitoring algorithm
+        Places a flow in the bucket of a tau value.
+        Buckets that are not yet part of the deadline queue are added to it
+        and the background thread is woken up to account for the new
+        deadline. The caller has to hold the schedule lock.
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param switch_id: The ID of the switch the flow is installed on
+        :type switch_id: int
+        :param tau: The tau value of the bucket
+        :type tau: int
         :return: None
         :rtype: None
         """
-        next_deadlines = {}
-        while True:
-
-            self.add_missing_flows()
+        super(PaylessSingleThread, self).schedule_flow(
+            flow_id, switch_id, tau
+        )
+        if tau not in self.scheduled_taus:
+            self.scheduled_taus.add(tau)
+            deadline = monotonic() + float(tau) / 1000.0
+            heapq.heappush(self.deadlines, (deadline, tau))
+            self.wakeup.set()
 
-            now_ms = time.time() * 1000
-            to_poll = []
+    def pop_due_buckets(self, now):
+        """
+        Removes all due buckets from the deadline queue and re-inserts them
+        with their next deadline. Buckets that no longer contain any flows
+        are dropped from the queue. The caller has to hold the schedule lock.
+        :param now: The current monotonic time in seconds
+        :type now: float
+        :return: Tuples of flow IDs and switch IDs of the flows in the due
+                 buckets
+        :rtype: list
+        """
+        to_poll = []
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            deadline, tau = heapq.heappop(self.deadlines)
+            flows = self.schedule_table.get(tau)
+            if not flows:
+                self.scheduled_taus.discard(tau)
+                continue
 
-            for tau in self.schedule_table.keys():
-                if tau not in next_deadlines:
-                    next_deadlines[tau] = now_ms + tau
+            to_poll.extend(flows.items())
 
-            for tau, deadline in next_deadlines.items():
-                if now_ms > deadline:
-                    next_deadlines[tau] = now_ms + tau
-                    for switch_id in self.schedule_table[tau].values():
-                        to_poll.append(switch_id)
+            # Keep the schedule free of drift unless we fell behind by
+            # more than a whole interval
+            tau_seconds = float(tau) / 1000.0
+            next_deadline = deadline + tau_seconds
+            if next_deadline <= now:
+                next_deadline = now + tau_seconds
+            heapq.heappush(self.deadlines, (next_deadline, tau))
+        return to_poll
 
-            self.logger.info("Sending stat requests to {}".format(to_poll))
-            for switch in to_poll:
-                self.app.send_flowstats_request(switch)
+    def background(self):
+        """
+        Periodically sends out FlowStatsRequests to the switches in accordance
+        with the payless adaptive monitoring algorithm.
+        The thread sleeps until the earliest bucket deadline is reached or a
+        new bucket is scheduled.
+        :return: None
+        :rtype: None
+        """
+        while True:
 
-            if len(next_deadlines) > 0:
-                next_deadline = min(next_deadlines.values())
+            self.schedule_lock.acquire()
+            now = monotonic()
+            to_poll = self.pop_due_buckets(now)
+            if len(self.deadlines) > 0:
+                next_deadline = self.deadlines[0][0]
             else:
-                next_deadline = self.tau_min + now_ms
+                next_deadline = None
+            self.wakeup.clear()
+            self.schedule_lock.release()
 
-            diff_ms = abs(next_deadline - now_ms)
-            diff_s = diff_ms / 1000
-            time.sleep(diff_s)
+            self.send_targeted_flowstats_requests(to_poll)
+
+            if next_deadline is None:
+                self.wakeup.wait()
+            else:
+                self.wakeup.wait(max(next_deadline - monotonic(), 0))
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import time
 from g3_payless.framework.RyuWrapper import RyuWrapper
 from g3_payless.monitoring.MonitoringAlgorithm import MonitoringAlgorithm
 
@@ -37,7 +36,7 @@ class PeriodicPollingPerFlow(MonitoringAlgorithm):
         :rtype None
         """
         while True:
-            time.sleep(self.polling_interval)
+            self.app.sleep(self.polling_interval)
             to_poll = [x.switch_id for x in self.app.active_flows.values()]
             self.logger.info("Sending stat requests to {}".format(to_poll))
             for switch_id in to_poll:
@@ -78,8 +77,4 @@ class PeriodicPollingPerFlow(MonitoringAlgorithm):
         :return: None
         :rtype: None
         """
-        for flow in event.msg.body:
-            flow_id = flow.cookie
-            event_byte_count = flow.byte_count
-            event_duration = self.calculate_duration_msec(flow)
-            self.insert_flow_stats(flow_id, event_byte_count, event_duration)
+        self.insert_flow_stats_reply(event.msg.body)
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import time
 from g3_payless.monitoring.PeriodicPollingPerFlow import PeriodicPollingPerFlow
 
 
@@ -26,7 +25,7 @@ class PeriodicPollingPerSwitch(PeriodicPollingPerFlow):
         :rtype None
         """
         while True:
-            time.sleep(self.polling_interval)
+            self.app.sleep(self.polling_interval)
             to_poll = [x for x in self.app.switches.keys()]
             self.logger.info("Sending stat requests to {}".format(to_poll))
             for switch_id in to_poll:
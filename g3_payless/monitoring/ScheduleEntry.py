@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+
+class ScheduleEntry(object):
+    """
+    The position of a flow in the payless schedule table
+    """
+
+    __slots__ = ("switch_id", "tau")
+
+    def __init__(self, switch_id, tau):
+        """
+        Initializes the schedule entry
+        :param switch_id: The ID of the switch the flow is installed on
+        :type switch_id: int
+        :param tau: The tau value of the bucket the flow is scheduled in
+        :type tau: int
+        """
+        self.switch_id = switch_id
+        self.tau = tau
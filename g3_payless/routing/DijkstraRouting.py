@@ -1,3 +1,4 @@
+from heapq import heappush, heappop
 from g3_payless.routing.RoutingAlgorithm import RoutingAlgorithm
 
 
@@ -8,83 +9,238 @@ class DijkstraRouting(RoutingAlgorithm):
 
     def calculate_routing_table(self):
         """
-        Calculates the routing table using Dijkstra's algorithm
+        Calculates the routing table using Dijkstra's algorithm.
+        The shortest path tree of each switch is calculated once and shared
+        by all hosts connected to that switch.
         :return: The routing table in the following format:
                     {switch_id: {(src_ip, dst_ip): port}}
         :rtype: dict
         """
 
         instructions = {switch: {} for switch in self.topology.keys()}
+        self.shortest_path_trees = {}
 
-        for src_host, src_subnet in self.host_subnets.items():
+        for src_host in self.host_subnets:
 
-            src_switch = [
-                switch for switch, info in self.topology.items()
-                if src_host in info
-            ][0]
-            switch_paths = self.calculate_paths_for_switch(src_switch)
+            src_switch = self.host_switches.get(src_host)
+            if src_switch is None:
+                continue
+            if src_switch not in self.shortest_path_trees:
+                self.shortest_path_trees[src_switch] = \
+                    self.calculate_paths_for_switch(src_switch)
+            switch_paths = self.shortest_path_trees[src_switch]
 
-            for dst_host, dst_subnet in self.host_subnets.items():
+            for switch, subnets, port in \
+                    self.calculate_routes(src_host, switch_paths):
+                instructions[switch][subnets] = port
 
-                if dst_host == src_host:
-                    continue
+        return instructions
 
-                dst_switch = [
-                    switch for switch, info in self.topology.items()
-                    if dst_host in info
-                ][0]
+    def calculate_routes(self, src_host, switch_paths, dst_hosts=None):
+        """
+        Calculates the routing table entries for the traffic of a host
+        :param src_host: The name of the source host
+        :type src_host: str
+        :param switch_paths: The shortest path tree of the switch the host is
+                             connected to, see calculate_paths_for_switch
+        :type switch_paths: dict
+        :param dst_hosts: The destination hosts to calculate the entries for.
+                          Defaults to all hosts
+        :type dst_hosts: list
+        :return: Tuples consisting of the switch name, the source and
+                 destination subnets and the port
+        :rtype: list
+        """
+        routes = []
+        src_subnet = self.host_subnets[src_host]
+        if dst_hosts is None:
+            dst_hosts = self.host_subnets.keys()
 
-                host_port = self.topology[dst_switch][dst_host][0]
-                instructions[dst_switch][(src_subnet, dst_subnet)] = host_port
+        for dst_host in dst_hosts:
 
-                current_node = dst_switch
-                while True:
-                    path_info = switch_paths[current_node]
-                    previous = path_info[1]
+            dst_subnet = self.host_subnets[dst_host]
+            dst_switch = self.host_switches.get(dst_host)
+            if dst_host == src_host or dst_switch is None:
+                continue
 
-                    if previous is None:
-                        break
+            host_port = self.get_link_port(dst_switch, dst_host)
+            routes.append((dst_switch, (src_subnet, dst_subnet), host_port))
 
-                    port = self.topology[previous][current_node][0]
-                    instructions[previous][(src_subnet, dst_subnet)] = port
+            current_node = dst_switch
+            while True:
+                path_info = switch_paths[current_node]
+                previous = path_info[1]
 
-                    current_node = previous
+                if previous is None:
+                    break
 
-        return instructions
+                port = self.get_link_port(previous, current_node)
+                routes.append((previous, (src_subnet, dst_subnet), port))
+
+                current_node = previous
+
+        return routes
+
+    def update_routing_table(self, changed_links):
+        """
+        Updates the routing table after links between switches changed.
+        Only the shortest path trees that use a changed link or that could
+        be improved by one are recalculated.
+        :param changed_links: The changed links as tuples of node names
+        :type changed_links: list
+        :return: The routing table entries that changed in the following
+                 format:
+                    {switch_id: {(src_ip, dst_ip): port}}
+                 Removed entries have the port None
+        :rtype: dict
+        """
+        diff = {}
+
+        for src_switch, old_paths in list(self.shortest_path_trees.items()):
+
+            if not self.is_tree_affected(old_paths, changed_links):
+                continue
+
+            new_paths = self.calculate_paths_for_switch(src_switch)
+            self.shortest_path_trees[src_switch] = new_paths
+
+            changed_paths = self.find_changed_paths(old_paths, new_paths)
+            src_hosts = []
+            dst_hosts = []
+            for host, switch in self.host_switches.items():
+                if switch == src_switch:
+                    src_hosts.append(host)
+                if changed_paths[switch]:
+                    dst_hosts.append(host)
+            if len(dst_hosts) == 0:
+                continue
+
+            old_routes = {}
+            new_routes = {}
+            for src_host in src_hosts:
+                old_host_routes = \
+                    self.calculate_routes(src_host, old_paths, dst_hosts)
+                for switch, subnets, port in old_host_routes:
+                    old_routes[(switch, subnets)] = port
+                new_host_routes = \
+                    self.calculate_routes(src_host, new_paths, dst_hosts)
+                for switch, subnets, port in new_host_routes:
+                    new_routes[(switch, subnets)] = port
+
+            for key in set(old_routes) | set(new_routes):
+                port = new_routes.get(key)
+                if old_routes.get(key) == port:
+                    continue
+                switch, subnets = key
+                if port is None:
+                    self.routing_table[switch].pop(subnets, None)
+                else:
+                    self.routing_table[switch][subnets] = port
+                if switch not in diff:
+                    diff[switch] = {}
+                diff[switch][subnets] = port
+
+        return diff
+
+    # noinspection PyMethodMayBeStatic
+    def find_changed_paths(self, old_paths, new_paths):
+        """
+        Determines which paths differ between two shortest path trees.
+        A path changed if the last hop of any node along it changed.
+        :param old_paths: The old shortest path tree
+        :type old_paths: dict
+        :param new_paths: The new shortest path tree
+        :type new_paths: dict
+        :return: A dictionary mapping node names to whether or not the path
+                 to the node changed
+        :rtype: dict
+        """
+        changed = {}
+        for node in new_paths:
+            walked = []
+            current_node = node
+            while current_node is not None and current_node not in changed:
+                walked.append(current_node)
+                old_last = old_paths.get(current_node, (None, None))[1]
+                new_last = new_paths[current_node][1]
+                if old_last != new_last:
+                    changed[current_node] = True
+                    walked.pop()
+                    break
+                current_node = new_last
+            result = changed.get(current_node, False)
+            for walked_node in walked:
+                changed[walked_node] = result
+        return changed
+
+    def is_tree_affected(self, switch_paths, changed_links):
+        """
+        Checks whether or not a shortest path tree has to be recalculated
+        after links changed. This is the case if the tree contains a changed
+        link or if a changed link offers a path that is at most as expensive
+        as the one in the tree.
+        :param switch_paths: The shortest path tree,
+                             see calculate_paths_for_switch
+        :type switch_paths: dict
+        :param changed_links: The changed links as tuples of node names
+        :type changed_links: list
+        :return: Whether or not the tree has to be recalculated
+        :rtype: bool
+        """
+        unreachable = (float("inf"), None)
+
+        for node_a, node_b in changed_links:
+            for src, dst in [(node_a, node_b), (node_b, node_a)]:
+
+                src_cost = switch_paths.get(src, unreachable)[0]
+                dst_cost, dst_last = switch_paths.get(dst, unreachable)
+
+                if dst_last == src:
+                    return True
+
+                link = self.topology.get(src, {}).get(dst)
+                if link is not None and src_cost != float("inf") \
+                        and src_cost + link[1] <= dst_cost:
+                    return True
+
+        return False
 
     def calculate_paths_for_switch(self, src_switch):
         """
         Calculates the shortest paths for a switch to all other switches
-        using Dijkstra's algorithm
+        using Dijkstra's algorithm with a binary heap.
+        Nodes with equal costs are visited in the order of the topology.
         :param src_switch: The name of the source switch
         :type src_switch: str
         :return: The distance/cost and last hop for each destination switch
         """
-        unvisited = {
-            x: (float("inf"), None)
-            for x in self.topology.keys()
-        }
-        unvisited[src_switch] = (0, None)
+        order = {node: index for index, node in enumerate(self.topology)}
+        costs = {src_switch: 0}
+        queue = [(0, order[src_switch], src_switch, None)]
         visited = {}
 
-        while len(unvisited) > 0:
-            current_node, (current_cost, last_node) = \
-                min(unvisited.items(), key=lambda x: x[1][0])
-            unvisited.pop(current_node)
+        while len(queue) > 0:
+            current_cost, _, current_node, last_node = heappop(queue)
+            if current_node in visited:
+                continue
+            visited[current_node] = (current_cost, last_node)
 
-            neighbours = [
-                x for x in self.topology[current_node]
-                if x in unvisited
-            ]
+            for neighbour, (_, link_cost) in \
+                    self.topology[current_node].items():
 
-            for neighbour in neighbours:
+                if neighbour in visited:
+                    continue
 
-                link_cost = self.topology[current_node][neighbour][1]
                 total_cost = link_cost + current_cost
 
-                if total_cost < unvisited[neighbour][0]:
-                    unvisited[neighbour] = (total_cost, current_node)
+                if total_cost < costs.get(neighbour, float("inf")):
+                    costs[neighbour] = total_cost
+                    heappush(queue, (
+                        total_cost, order[neighbour], neighbour, current_node
+                    ))
 
-            visited[current_node] = (current_cost, last_node)
+        for node in self.topology:
+            if node not in visited:
+                visited[node] = (float("inf"), None)
 
         return visited
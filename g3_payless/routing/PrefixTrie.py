@@ -0,0 +1,109 @@
+import socket
+import struct
+from netaddr import IPNetwork
+
+
+BIT_SHIFTS = tuple(range(31, -1, -1))
+"""
+The shifts needed to extract the bits of an IPv4 address, starting with the
+most significant bit
+"""
+
+
+def ipv4_to_int(address):
+    """
+    Converts an IPv4 address string to an integer
+    :param address: The IPv4 address
+    :type address: str
+    :return: The address as integer
+    :rtype: int
+    """
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+def parse_ipv4_subnet(subnet):
+    """
+    Parses an IPv4 subnet string
+    :param subnet: The subnet, for example 11.0.0.0/8
+    :type subnet: str
+    :return: A tuple consisting of:
+                * The address as integer
+                * The prefix length
+                * The normalized subnet string
+    :rtype: tuple
+    """
+    network = IPNetwork(subnet)
+    return network.value, network.prefixlen, str(network)
+
+
+class PrefixTrie(object):
+    """
+    Binary trie that maps IPv4 prefixes to values and supports
+    longest prefix matching.
+    Nodes are lists consisting of the child for a 0 bit, the child for a
+    1 bit and the value stored for the prefix of the node.
+    """
+
+    def __init__(self):
+        """
+        Initializes the empty trie
+        """
+        self.root = [None, None, None]
+
+    def insert(self, address, prefix_length, value):
+        """
+        Stores a value for an IPv4 prefix
+        :param address: The address of the prefix as integer
+        :type address: int
+        :param prefix_length: The length of the prefix
+        :type prefix_length: int
+        :param value: The value to store
+        :type value: object
+        :return: None
+        :rtype: None
+        """
+        node = self.root
+        for shift in BIT_SHIFTS[:prefix_length]:
+            bit = (address >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = value
+
+    def matches(self, address):
+        """
+        Finds the values of all prefixes that contain an address
+        :param address: The address as integer, see ipv4_to_int
+        :type address: int
+        :return: The values, ordered from the longest to the shortest prefix
+        :rtype: list
+        """
+        node = self.root
+        found = []
+        if node[2] is not None:
+            found.append(node[2])
+        for shift in BIT_SHIFTS:
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found.append(node[2])
+        found.reverse()
+        return found
+
+    def longest_match(self, address):
+        """
+        Finds the value of the longest prefix that contains an address
+        :param address: The address as integer, see ipv4_to_int
+        :type address: int
+        :return: The value or None if no prefix contains the address
+        """
+        node = self.root
+        longest = node[2]
+        for shift in BIT_SHIFTS:
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                longest = node[2]
+        return longest
@@ -1,5 +1,7 @@
 import yaml
-from netaddr import IPAddress, IPNetwork
+from netaddr import IPNetwork, cidr_merge
+from g3_payless.routing.PrefixTrie import PrefixTrie, ipv4_to_int, \
+    parse_ipv4_subnet
 
 
 class RoutingAlgorithm(object):
@@ -7,18 +9,32 @@ class RoutingAlgorithm(object):
     Class that defines a framework for routing algorithms
     """
 
-    def __init__(self, topology_file):
+    ANY_SUBNET = "0.0.0.0/0"
+    """
+    The source subnet of aggregated routes that only match the destination
+    """
+
+    def __init__(self, topology_file, route_aggregation=False):
         """
         Initializes the routing algorithm
         :param topology_file: The path to the topology file for which to create
                               routing decisions
         :type topology_file: str
+        :param route_aggregation: Whether or not to aggregate the routing
+                                  table into fewer, wider routes,
+                                  see aggregate_routing_table
+        :type route_aggregation: bool
         """
         with open(topology_file, "r") as f:
             self.config = yaml.safe_load(f.read())["root"]["topology"]
         self.host_subnets, self.switch_names, self.topology = \
             self.generate_topology()
+        self.host_switches = self.calculate_host_switches()
+        self.down_links = {}
+        self.route_aggregation = route_aggregation
         self.routing_table = self.calculate_routing_table()
+        self.forwarding_table = self.calculate_forwarding_table()
+        self.routing_tries = {}
 
     def calculate_routing_table(self):
         """
@@ -62,10 +78,310 @@ class RoutingAlgorithm(object):
             topology[dst][src] = (dst_port, link_speed)
         return host_subnets, switch_names, topology
 
+    def calculate_forwarding_table(self):
+        """
+        Calculates the routes that are actually installed on the switches.
+        This is the routing table itself, or its aggregation if route
+        aggregation is enabled
+        :return: The forwarding table in the following format:
+                    {switch_id: {(src_ip, dst_ip): port}}
+        :rtype: dict
+        """
+        if not self.route_aggregation:
+            return self.routing_table
+        return {
+            switch: self.aggregate_routing_table(switch_routing_table)
+            for switch, switch_routing_table in self.routing_table.items()
+        }
+
+    def aggregate_routing_table(self, switch_routing_table):
+        """
+        Aggregates the routing table of a switch into fewer routes with the
+        same forwarding behaviour for the hosts of the topology:
+            * If all routes to a destination use the same port, they are
+              replaced by a single route from ANY_SUBNET
+            * Destination-only routes using the same port are merged into
+              the smallest list of covering subnets, unless a merged subnet
+              would overlap with the destination of another route
+        :param switch_routing_table: The routing table of the switch in the
+                                     following format:
+                                        {(src_ip, dst_ip): port}
+        :type switch_routing_table: dict
+        :return: The aggregated routing table in the same format
+        :rtype: dict
+        """
+        destinations = {}
+        for (src_subnet, dst_subnet), port in switch_routing_table.items():
+            if dst_subnet not in destinations:
+                destinations[dst_subnet] = {}
+            destinations[dst_subnet][src_subnet] = port
+
+        aggregated = {}
+        port_destinations = {}
+        for dst_subnet, sources in destinations.items():
+            ports = set(sources.values())
+            if len(ports) == 1:
+                port = ports.pop()
+                if port not in port_destinations:
+                    port_destinations[port] = []
+                port_destinations[port].append(dst_subnet)
+            else:
+                for src_subnet, port in sources.items():
+                    aggregated[(src_subnet, dst_subnet)] = port
+
+        networks = {
+            dst_subnet: IPNetwork(dst_subnet) for dst_subnet in destinations
+        }
+        for port, dst_subnets in port_destinations.items():
+            other_networks = [
+                network for dst_subnet, network in networks.items()
+                if dst_subnet not in dst_subnets
+            ]
+            merged_networks = cidr_merge(
+                [networks[dst_subnet] for dst_subnet in dst_subnets]
+            )
+            for merged_network in merged_networks:
+                merged_subnets = [
+                    dst_subnet for dst_subnet in dst_subnets
+                    if networks[dst_subnet] in merged_network
+                ]
+                overlapping = any(
+                    network in merged_network or merged_network in network
+                    for network in other_networks
+                )
+                if len(merged_subnets) > 1 and not overlapping:
+                    merged_subnets = [str(merged_network)]
+                for dst_subnet in merged_subnets:
+                    aggregated[(self.ANY_SUBNET, dst_subnet)] = port
+
+        return aggregated
+
+    def update_forwarding_table(self, routing_diff):
+        """
+        Updates the forwarding table after the routing table changed
+        :param routing_diff: The routing table entries that changed,
+                             see update_links
+        :type routing_diff: dict
+        :return: The forwarding table entries that changed, in the same
+                 format
+        :rtype: dict
+        """
+        if not self.route_aggregation:
+            self.forwarding_table = self.routing_table
+            return routing_diff
+
+        forwarding_table = dict(self.forwarding_table)
+        for switch in routing_diff:
+            forwarding_table[switch] = self.aggregate_routing_table(
+                self.routing_table.get(switch, {})
+            )
+        diff = self.calculate_diff(self.forwarding_table, forwarding_table)
+        self.forwarding_table = forwarding_table
+        return diff
+
+    # noinspection PyMethodMayBeStatic
+    def calculate_diff(self, old_table, new_table):
+        """
+        Calculates the entries that differ between two routing tables
+        :param old_table: The old routing table
+        :type old_table: dict
+        :param new_table: The new routing table
+        :type new_table: dict
+        :return: The entries that changed, see update_links
+        :rtype: dict
+        """
+        diff = {}
+        for switch in set(old_table) | set(new_table):
+            old_entries = old_table.get(switch, {})
+            new_entries = new_table.get(switch, {})
+            changes = {
+                key: new_entries.get(key)
+                for key in set(old_entries) | set(new_entries)
+                if old_entries.get(key) != new_entries.get(key)
+            }
+            if len(changes) > 0:
+                diff[switch] = changes
+        return diff
+
+    # noinspection PyMethodMayBeStatic
+    def compile_routing_table(self, switch_routing_table):
+        """
+        Compiles the routing table of a switch into a two-level prefix trie.
+        The first level matches the source address, its values are
+        prefix tries matching the destination address.
+        :param switch_routing_table: The routing table of the switch in the
+                                     following format:
+                                        {(src_ip, dst_ip): port}
+        :type switch_routing_table: dict
+        :return: The compiled routing table
+        :rtype: PrefixTrie
+        """
+        subnets = {}
+        routes = {}
+        for (src_subnet, dst_subnet), port in switch_routing_table.items():
+            for subnet in [src_subnet, dst_subnet]:
+                if subnet not in subnets:
+                    subnets[subnet] = parse_ipv4_subnet(subnet)
+            src_prefix = subnets[src_subnet][0:2]
+            if src_prefix not in routes:
+                routes[src_prefix] = []
+            routes[src_prefix].append((src_subnet, dst_subnet, port))
+
+        src_trie = PrefixTrie()
+        for (src_address, src_length), dst_routes in routes.items():
+            dst_trie = PrefixTrie()
+            for src_subnet, dst_subnet, port in dst_routes:
+                dst_address, dst_length, dst_string = subnets[dst_subnet]
+                dst_trie.insert(dst_address, dst_length, (
+                    port, subnets[src_subnet][2], dst_string
+                ))
+            src_trie.insert(src_address, src_length, dst_trie)
+        return src_trie
+
+    def get_link_port(self, src, dst):
+        """
+        Retrieves the port of a link, even if the link is down
+        :param src: The name of the node the port belongs to
+        :type src: str
+        :param dst: The name of the node on the other side of the link
+        :type dst: str
+        :return: The port
+        :rtype: int
+        """
+        if dst in self.topology[src]:
+            return self.topology[src][dst][0]
+        return self.down_links[(src, dst)][0]
+
+    def set_link(self, node_a, node_b, link_speed):
+        """
+        Changes the state of a link in the topology.
+        Links that go down keep their ports when they come back up, new links
+        are assigned the next free port on both nodes
+        :param node_a: The name of the node on one side of the link
+        :type node_a: str
+        :param node_b: The name of the node on the other side of the link
+        :type node_b: str
+        :param link_speed: The new link speed or None if the link went down
+        :type link_speed: int
+        :return: Whether or not the topology changed
+        :rtype: bool
+        """
+        changed = False
+        for src, dst in [(node_a, node_b), (node_b, node_a)]:
+            if src not in self.topology:
+                self.topology[src] = {}
+            links = self.topology[src]
+
+            if link_speed is None:
+                if dst in links:
+                    self.down_links[(src, dst)] = links.pop(dst)
+                    changed = True
+                continue
+
+            if dst in links:
+                port, old_link_speed = links[dst]
+            elif (src, dst) in self.down_links:
+                port, old_link_speed = self.down_links.pop((src, dst))
+                old_link_speed = None
+            else:
+                ports = [port for port, _ in links.values()] + [
+                    port for (node, _), (port, _) in self.down_links.items()
+                    if node == src
+                ]
+                port = max(ports + [0]) + 1
+                old_link_speed = None
+
+            links[dst] = (port, link_speed)
+            changed = changed or old_link_speed != link_speed
+        return changed
+
+    def update_links(self, changes):
+        """
+        Applies link changes to the topology and updates the routing table
+        :param changes: The changed links as tuples consisting of:
+                            * The name of the node on one side of the link
+                            * The name of the node on the other side
+                            * The new link speed or None if the link went down
+        :type changes: list
+        :return: The forwarding table entries that changed in the following
+                 format:
+                    {switch_id: {(src_ip, dst_ip): port}}
+                 Removed entries have the port None
+        :rtype: dict
+        """
+        changed_links = [
+            (node_a, node_b)
+            for node_a, node_b, link_speed in changes
+            if self.set_link(node_a, node_b, link_speed)
+        ]
+        if len(changed_links) == 0:
+            return {}
+
+        for node in self.topology:
+            if node not in self.routing_table:
+                self.routing_table[node] = {}
+
+        host_links = [
+            link for link in changed_links
+            if link[0] in self.host_subnets or link[1] in self.host_subnets
+        ]
+        if len(host_links) > 0:
+            self.host_switches = self.calculate_host_switches()
+            diff = self.replace_routing_table(self.calculate_routing_table())
+        else:
+            diff = self.update_routing_table(changed_links)
+        diff = self.update_forwarding_table(diff)
+
+        for switch in diff:
+            self.routing_tries.pop(switch, None)
+        return diff
+
+    def update_routing_table(self, changed_links):
+        """
+        Updates the routing table after links between switches changed.
+        Child classes may overwrite this to only recalculate the affected
+        routes, by default the entire routing table is recalculated.
+        :param changed_links: The changed links as tuples of node names
+        :type changed_links: list
+        :return: The routing table entries that changed, see update_links
+        :rtype: dict
+        """
+        return self.replace_routing_table(self.calculate_routing_table())
+
+    def replace_routing_table(self, routing_table):
+        """
+        Replaces the routing table
+        :param routing_table: The new routing table
+        :type routing_table: dict
+        :return: The routing table entries that changed, see update_links
+        :rtype: dict
+        """
+        diff = self.calculate_diff(self.routing_table, routing_table)
+        self.routing_table = routing_table
+        return diff
+
+    def calculate_host_switches(self):
+        """
+        Determines the switch each host is connected to
+        :return: A dictionary mapping host names to switch names
+        :rtype: dict
+        """
+        host_switches = {}
+        for switch, neighbours in self.topology.items():
+            for neighbour in neighbours:
+                if neighbour in self.host_subnets \
+                        and neighbour not in host_switches:
+                    host_switches[neighbour] = switch
+        return host_switches
+
     def calculate_routing_decision(self, switch_id, _src_ip, _dst_ip):
         """
         Calculates the port on which to forward a packet based on
-        the source and destination IP address and the static routing table
+        the source and destination IP address and the static routing table.
+        The most specific source subnet with a matching destination subnet
+        is used.
+        The routing table of a switch is compiled into a prefix trie when the
+        switch makes its first routing decision.
         :param switch_id: The ID of the switch for which to decide the port
         :type switch_id: int
         :param _src_ip: The source IP address
@@ -76,16 +392,20 @@ class RoutingAlgorithm(object):
                     * The port on which to forward
                     * The source subnet
                     * The destination subnet
+                 or None if no route exists
         :rtype: tuple
         """
         switch_name = self.switch_names[switch_id]
-        switch_routing_table = self.routing_table[switch_name]
-        src_ip = IPAddress(_src_ip)
-        dst_ip = IPAddress(_dst_ip)
-
-        for (_src_subnet, _dst_subnet), port in switch_routing_table.items():
-            src_subnet = IPNetwork(_src_subnet)
-            dst_subnet = IPNetwork(_dst_subnet)
+        src_trie = self.routing_tries.get(switch_name)
+        if src_trie is None:
+            src_trie = self.compile_routing_table(
+                self.forwarding_table[switch_name]
+            )
+            self.routing_tries[switch_name] = src_trie
+        dst_ip = ipv4_to_int(_dst_ip)
 
-            if src_ip in src_subnet and dst_ip in dst_subnet:
-                return port, str(src_subnet), str(dst_subnet)
+        for dst_trie in src_trie.matches(ipv4_to_int(_src_ip)):
+            decision = dst_trie.longest_match(dst_ip)
+            if decision is not None:
+                return decision
+        return None
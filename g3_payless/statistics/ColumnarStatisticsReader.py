@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+# noinspection PyPackageRequirements
+import numpy
+from g3_payless.statistics.ColumnarStatisticsWriter import \
+    ColumnarStatisticsWriter
+
+
+class ColumnarStatisticsReader(object):
+    """
+    Reads statistics written by the ColumnarStatisticsWriter.
+    Samples are memory-mapped instead of being loaded into memory.
+    """
+
+    def __init__(self, directory):
+        """
+        Initializes the reader by loading the metadata
+        :param directory: The directory containing the statistics
+        :type directory: str
+        """
+        self.directory = directory
+        with open(os.path.join(directory, ColumnarStatisticsWriter.META_FILE),
+                  "r") as f:
+            self.meta = json.load(f)
+        self.algorithm = self.meta["algorithm"]
+        self.flow_info = self.read_flow_info()
+        self.flow_dtype = numpy.dtype([
+            (column, "<i8") for column in self.meta["flow_columns"]
+        ])
+        self.overhead_dtype = numpy.dtype([
+            (column, "<i8") for column in self.meta["overhead_columns"]
+        ])
+
+    @staticmethod
+    def is_columnar(path):
+        """
+        Checks whether or not a path points to columnar statistics
+        :param path: The path to check
+        :type path: str
+        :return: True if the path is a directory containing columnar
+                 statistics
+        :rtype: bool
+        """
+        return os.path.isfile(
+            os.path.join(path, ColumnarStatisticsWriter.META_FILE)
+        )
+
+    def read_flow_info(self):
+        """
+        Reads the flow info. A partially written last line is ignored
+        :return: The JSON representations of the flows in the following
+                 format:
+                    {flow_id: flow_json}
+        :rtype: dict
+        """
+        flow_info = {}
+        path = os.path.join(
+            self.directory, ColumnarStatisticsWriter.FLOW_INFO_FILE
+        )
+        if not os.path.isfile(path):
+            return flow_info
+        with open(path, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                flow_json = json.loads(line)
+                flow_info[str(flow_json["flow_id"])] = flow_json
+        return flow_info
+
+    # noinspection PyMethodMayBeStatic
+    def memmap(self, path, dtype):
+        """
+        Memory-maps a file of records. A partially written last record is
+        ignored
+        :param path: The path to the file
+        :type path: str
+        :param dtype: The record type
+        :type dtype: numpy.dtype
+        :return: The records
+        :rtype: numpy.ndarray
+        """
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        count = size // dtype.itemsize
+        if count == 0:
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def flow_ids(self):
+        """
+        :return: The IDs of all flows with flow info
+        :rtype: list
+        """
+        return list(self.flow_info.keys())
+
+    def flow_samples(self, flow_id):
+        """
+        Memory-maps the samples of a flow
+        :param flow_id: The ID of the flow
+        :type flow_id: str
+        :return: The samples as records of the fields in FLOW_COLUMNS
+        :rtype: numpy.ndarray
+        """
+        path = os.path.join(self.directory, "flows", "{}.bin".format(flow_id))
+        return self.memmap(path, self.flow_dtype)
+
+    def overhead(self):
+        """
+        Memory-maps the overhead datapoints
+        :return: The datapoints as records of the fields in OVERHEAD_COLUMNS
+        :rtype: numpy.ndarray
+        """
+        path = os.path.join(self.directory, "overhead.bin")
+        return self.memmap(path, self.overhead_dtype)
+
+    def read(self):
+        """
+        Reconstructs the statistics in the format of the JSON statistics
+        file, as loaded by json.load. This materializes all samples and
+        should only be used by consumers that can't work with the
+        memory-mapped samples. The totals are not part of the columnar format
+        and therefore missing.
+        :return: The statistics in the following format:
+                    {
+                        "flow_stats": {flow_id: {timestamp: {column: value}}},
+                        "overhead": {timestamp: overhead},
+                        "flow_info": {flow_id: flow_json},
+                        "algorithm": algorithm_name
+                    }
+        :rtype: dict
+        """
+        flow_stats = {}
+        for flow_id in self.flow_ids():
+            samples = self.flow_samples(flow_id)
+            if len(samples) == 0:
+                continue
+            flow_stats[flow_id] = {
+                repr(timestamp_ms / 1000.0): {
+                    "bytes": flow_bytes,
+                    "duration": duration
+                }
+                for timestamp_ms, flow_bytes, duration in samples.tolist()
+            }
+
+        overhead = {
+            repr(timestamp_ms / 1000.0): value
+            for timestamp_ms, value in self.overhead().tolist()
+        }
+
+        return {
+            "flow_stats": flow_stats,
+            "overhead": overhead,
+            "flow_info": self.flow_info,
+            "algorithm": self.algorithm
+        }
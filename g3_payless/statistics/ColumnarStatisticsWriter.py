@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+from array import array
+
+try:
+    array("q")
+    INT64_TYPECODE = "q"
+except ValueError:  # Python 2, where longs have 64 bits on 64 bit Linux
+    INT64_TYPECODE = "l"
+
+
+class ColumnarStatisticsWriter(object):
+    """
+    Writes statistics in a columnar binary format that can be memory-mapped
+    by readers. The format is a directory containing:
+        * meta.json: The name of the algorithm and the record layouts
+        * flows.ndjson: The JSON representation of every flow, one per line
+        * flows/<flow_id>.bin: One record per sample of the flow
+        * overhead.bin: One record per overhead datapoint
+    Records consist of little-endian 64 bit integers, see FLOW_COLUMNS and
+    OVERHEAD_COLUMNS. Timestamps are stored in milliseconds.
+    Only new flows and samples are appended on every write and meta.json is
+    written atomically once, so readers can open the directory while it is
+    written.
+    """
+
+    FLOW_COLUMNS = ["timestamp_ms", "bytes", "duration"]
+    """
+    The fields of the records in the per-flow files
+    """
+
+    OVERHEAD_COLUMNS = ["timestamp_ms", "overhead"]
+    """
+    The fields of the records in the overhead file
+    """
+
+    META_FILE = "meta.json"
+    """
+    The name of the file containing the metadata
+    """
+
+    FLOW_INFO_FILE = "flows.ndjson"
+    """
+    The name of the file containing the flow info
+    """
+
+    FORMAT = "columnar"
+    """
+    The format identifier stored in the metadata
+    """
+
+    def __init__(self, directory, algorithm):
+        """
+        Initializes the writer. Statistics of previous runs in the directory
+        are deleted
+        :param directory: The directory in which to store the statistics
+        :type directory: str
+        :param algorithm: The name of the monitoring algorithm
+        :type algorithm: str
+        """
+        self.directory = directory
+        self.flow_directory = os.path.join(directory, "flows")
+        self.algorithm = algorithm
+        self.written_flows = set()
+        self.flow_cursors = {}
+        self.overhead_cursor = 0
+
+        if not os.path.isdir(self.flow_directory):
+            os.makedirs(self.flow_directory)
+        for name in os.listdir(self.flow_directory):
+            os.remove(os.path.join(self.flow_directory, name))
+        for name in ["overhead.bin", self.FLOW_INFO_FILE]:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                os.remove(path)
+        self.write_meta()
+
+    def write(self, statistics, overhead_datapoints, flows):
+        """
+        Appends all flows, flow statistics and overhead datapoints that were
+        added since the previous write.
+        Samples that were evicted from the time series' full resolution
+        before they could be written are skipped. The statistics may be a
+        snapshot that only contains the samples past flow_cursors, see
+        FlowStatistics.snapshot
+        :param statistics: The flow statistics
+        :type statistics: FlowStatistics
+        :param overhead_datapoints: The overhead datapoints
+        :type overhead_datapoints: TimeSeries
+        :param flows: The flows in the following format:
+                        {flow_id: Flow}
+        :type flows: Mapping
+        :return: The number of written samples
+        :rtype: int
+        """
+        new_flows = {
+            flow_id: flow.__json__()
+            for flow_id, flow in flows.items()
+            if flow_id not in self.written_flows
+        }
+        if len(new_flows) > 0:
+            self.add_flow_info(new_flows)
+
+        sample_count = 0
+        for flow_id, series in statistics.items():
+            cursor = self.flow_cursors.get(flow_id, 0)
+            samples = series.tail(series.appended - cursor)
+            self.flow_cursors[flow_id] = series.appended
+            self.append_flow_samples(flow_id, [
+                (timestamp, sample[1], sample[2])
+                for timestamp, sample in
+                zip(self.to_milliseconds(samples), samples)
+            ])
+            sample_count += len(samples)
+
+        samples = overhead_datapoints.tail(
+            overhead_datapoints.appended - self.overhead_cursor
+        )
+        self.overhead_cursor = overhead_datapoints.appended
+        self.append_overhead([
+            (timestamp, sample[1])
+            for timestamp, sample in
+            zip(self.to_milliseconds(samples), samples)
+        ])
+        sample_count += len(samples)
+
+        return sample_count
+
+    def forget(self, flow_ids):
+        """
+        Discards the cursors and the written state of flows that were
+        evicted from memory after their final statistics have been written
+        :param flow_ids: The IDs of the flows
+        :type flow_ids: list
+        :return: None
+        :rtype: None
+        """
+        for flow_id in flow_ids:
+            self.flow_cursors.pop(flow_id, None)
+            self.written_flows.discard(flow_id)
+
+    # noinspection PyMethodMayBeStatic
+    def to_milliseconds(self, samples):
+        """
+        :param samples: Samples whose first value is a timestamp in seconds
+        :type samples: list
+        :return: The timestamps of the samples in milliseconds
+        :rtype: list
+        """
+        return [int(round(sample[0] * 1000)) for sample in samples]
+
+    def add_flow_info(self, flow_info):
+        """
+        Appends flows to the flow info file
+        :param flow_info: The JSON representations of the flows in the
+                          following format:
+                            {flow_id: flow_json}
+        :type flow_info: dict
+        :return: None
+        :rtype: None
+        """
+        self.written_flows.update(flow_info.keys())
+        with open(os.path.join(self.directory, self.FLOW_INFO_FILE),
+                  "a") as f:
+            f.write("".join(
+                json.dumps(flow_json) + "\n"
+                for flow_json in flow_info.values()
+            ))
+
+    def append_flow_samples(self, flow_id, samples):
+        """
+        Appends samples to the file of a flow
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param samples: Tuples consisting of the timestamp in milliseconds,
+                        the byte count and the duration
+        :type samples: list
+        :return: None
+        :rtype: None
+        """
+        path = os.path.join(self.flow_directory, "{}.bin".format(flow_id))
+        self.append_records(path, samples)
+
+    def append_overhead(self, samples):
+        """
+        Appends overhead datapoints to the overhead file
+        :param samples: Tuples consisting of the timestamp in milliseconds
+                        and the overhead
+        :type samples: list
+        :return: None
+        :rtype: None
+        """
+        self.append_records(os.path.join(self.directory, "overhead.bin"),
+                            samples)
+
+    # noinspection PyMethodMayBeStatic
+    def append_records(self, path, records):
+        """
+        Appends records of 64 bit integers to a file
+        :param path: The path to the file
+        :type path: str
+        :param records: The records as tuples of integers
+        :type records: list
+        :return: None
+        :rtype: None
+        """
+        if len(records) == 0:
+            return
+        data = array(INT64_TYPECODE, [
+            int(value) for record in records for value in record
+        ])
+        if sys.byteorder != "little":
+            data.byteswap()
+        with open(path, "ab") as f:
+            data.tofile(f)
+
+    def write_meta(self):
+        """
+        Atomically writes the metadata file
+        :return: None
+        :rtype: None
+        """
+        meta = {
+            "format": self.FORMAT,
+            "algorithm": self.algorithm,
+            "flow_columns": self.FLOW_COLUMNS,
+            "overhead_columns": self.OVERHEAD_COLUMNS
+        }
+        path = os.path.join(self.directory, self.META_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + ".tmp", path)
+
+    def close(self):
+        """
+        Completes the statistics. Nothing has to be done, since every write
+        is appended to the files right away
+        :return: None
+        :rtype: None
+        """
+        pass
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+
+class FlowState(object):
+    """
+    The most recently collected counters of a flow
+    """
+
+    __slots__ = ("total_bytes", "duration")
+
+    def __init__(self, total_bytes=0, duration=0):
+        """
+        Initializes the flow state
+        :param total_bytes: The total byte count of the flow
+        :type total_bytes: int
+        :param duration: The total duration of the flow in milliseconds
+        :type duration: int
+        """
+        self.total_bytes = total_bytes
+        self.duration = duration
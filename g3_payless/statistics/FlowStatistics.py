@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from g3_payless.statistics.TimeSeries import TimeSeries
+
+
+class FlowStatistics(object):
+    """
+    Stores the collected statistics of every flow in a bounded time series
+    """
+
+    COLUMNS = [
+        ("timestamp", "d", TimeSeries.LAST),
+        ("bytes", "l", TimeSeries.SUM),
+        ("duration", "l", TimeSeries.SUM),
+        ("total_bytes", "l", TimeSeries.FIRST),
+        ("total_duration", "l", TimeSeries.FIRST)
+    ]
+    """
+    The columns of the per-flow time series. Durations are stored in whole
+    milliseconds. When downsampling, the byte and duration differences are
+    added up while the totals keep the values the merged interval started at
+    """
+
+    def __init__(self, retention=3600, downsampling=0, archive_retention=3600):
+        """
+        Initializes the flow statistics
+        :param retention: The number of samples per flow kept at full
+                          resolution
+        :type retention: int
+        :param downsampling: The number of evicted samples to merge into a
+                             single archived sample. 0 disables archiving
+        :type downsampling: int
+        :param archive_retention: The number of archived samples to keep
+                                  per flow
+        :type archive_retention: int
+        """
+        self.retention = retention
+        self.downsampling = downsampling
+        self.archive_retention = archive_retention
+        self.flows = {}
+        self.lock = Lock()
+
+    def add(
+            self,
+            flow_id,
+            timestamp,
+            bytes_diff,
+            duration_diff,
+            total_bytes,
+            total_duration
+    ):
+        """
+        Adds a sample to the time series of a flow
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param timestamp: The time the sample was collected
+        :type timestamp: float
+        :param bytes_diff: The byte count difference to the previous sample
+        :type bytes_diff: int
+        :param duration_diff: The duration difference to the previous sample
+        :type duration_diff: int
+        :param total_bytes: The total byte count of the previous sample
+        :type total_bytes: int
+        :param total_duration: The total duration of the previous sample
+        :type total_duration: int
+        :return: None
+        :rtype: None
+        """
+        with self.lock:
+            self.write_sample(
+                flow_id,
+                timestamp,
+                bytes_diff,
+                duration_diff,
+                total_bytes,
+                total_duration
+            )
+
+    def add_samples(self, timestamp, samples):
+        """
+        Adds samples that were collected at the same time, for example
+        from a single FlowStatsReply, taking the lock only once
+        :param timestamp: The time the samples were collected
+        :type timestamp: float
+        :param samples: Tuples consisting of the flow ID, the byte count
+                        difference, the duration difference, the total byte
+                        count and the total duration, see add
+        :type samples: list
+        :return: None
+        :rtype: None
+        """
+        write_sample = self.write_sample
+        with self.lock:
+            for flow_id, bytes_diff, duration_diff, total_bytes, \
+                    total_duration in samples:
+                write_sample(
+                    flow_id,
+                    timestamp,
+                    bytes_diff,
+                    duration_diff,
+                    total_bytes,
+                    total_duration
+                )
+
+    def write_sample(
+            self,
+            flow_id,
+            timestamp,
+            bytes_diff,
+            duration_diff,
+            total_bytes,
+            total_duration
+    ):
+        """
+        Writes a sample directly into the columns of the time series of a
+        flow. The caller has to hold the lock
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param timestamp: The time the sample was collected
+        :type timestamp: float
+        :param bytes_diff: The byte count difference to the previous sample
+        :type bytes_diff: int
+        :param duration_diff: The duration difference to the previous sample
+        :type duration_diff: int
+        :param total_bytes: The total byte count of the previous sample
+        :type total_bytes: int
+        :param total_duration: The total duration of the previous sample
+        :type total_duration: int
+        :return: None
+        :rtype: None
+        """
+        series = self.flows.get(flow_id)
+        if series is None:
+            series = TimeSeries(
+                self.COLUMNS,
+                self.retention,
+                self.downsampling,
+                self.archive_retention
+            )
+            self.flows[flow_id] = series
+
+        index = series.reserve()
+        if index is None:
+            return
+        timestamp_column, bytes_column, duration_column, \
+            total_bytes_column, total_duration_column = series.data
+        timestamp_column[index] = timestamp
+        bytes_column[index] = bytes_diff
+        duration_column[index] = duration_diff
+        total_bytes_column[index] = total_bytes
+        total_duration_column[index] = total_duration
+
+    def remove(self, flow_id, cursor=None):
+        """
+        Discards the time series of a flow, for example once the final
+        statistics of a removed flow have been written
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :param cursor: If given, the time series is only discarded if no
+                       samples were appended after this value of its
+                       appended counter
+        :type cursor: int
+        :return: Whether or not the time series was discarded
+        :rtype: bool
+        """
+        with self.lock:
+            series = self.flows.get(flow_id)
+            if series is not None and cursor is not None \
+                    and series.appended > cursor:
+                return False
+            self.flows.pop(flow_id, None)
+            return True
+
+    def snapshot(self, cursors=None):
+        """
+        Creates a copy of the statistics that is not affected by samples
+        added later on. Every time series is copied under the lock on its
+        own, so adding samples is only blocked for the duration of a single
+        copy
+        :param cursors: If given, only the samples appended after these
+                        cursors are copied, see TimeSeries.tail_snapshot.
+                        Flows without new samples are left out. The format
+                        of the cursors is:
+                            {flow_id: appended}
+        :type cursors: dict
+        :return: The copy
+        :rtype: FlowStatistics
+        """
+        snapshot = FlowStatistics(
+            self.retention, self.downsampling, self.archive_retention
+        )
+        for flow_id, series in self.items():
+            if cursors is None:
+                with self.lock:
+                    snapshot.flows[flow_id] = series.snapshot()
+                continue
+
+            cursor = cursors.get(flow_id, 0)
+            if series.appended == cursor:
+                continue
+            with self.lock:
+                snapshot.flows[flow_id] = series.tail_snapshot(cursor)
+        return snapshot
+
+    def __contains__(self, flow_id):
+        """
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :return: Whether or not statistics exist for the flow
+        :rtype: bool
+        """
+        return flow_id in self.flows
+
+    def __getitem__(self, flow_id):
+        """
+        :param flow_id: The ID of the flow
+        :type flow_id: int
+        :return: The time series of the flow
+        :rtype: TimeSeries
+        """
+        return self.flows[flow_id]
+
+    def __len__(self):
+        """
+        :return: The number of flows with statistics
+        :rtype: int
+        """
+        return len(self.flows)
+
+    def items(self):
+        """
+        :return: Tuples of flow IDs and their time series
+        :rtype: list
+        """
+        return list(self.flows.items())
+
+    def __json__(self):
+        """
+        :return: A dictionary representation of the statistics in the
+                 following format:
+                    {flow_id: {timestamp: {column: value}}}
+        :rtype: dict
+        """
+        return {
+            flow_id: series.__json__()
+            for flow_id, series in self.items()
+        }
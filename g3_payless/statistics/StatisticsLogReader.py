@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+from g3_payless.statistics.StatisticsLogWriter import StatisticsLogWriter
+
+
+class StatisticsLogReader(object):
+    """
+    Reads statistics logs written by the StatisticsLogWriter
+    """
+
+    def __init__(self, directory):
+        """
+        Initializes the reader
+        :param directory: The directory containing the log segments
+        :type directory: str
+        """
+        self.directory = directory
+
+    @staticmethod
+    def is_log(path):
+        """
+        Checks whether or not a path points to a statistics log
+        :param path: The path to check
+        :type path: str
+        :return: True if the path is a directory containing log segments
+        :rtype: bool
+        """
+        if not os.path.isdir(path):
+            return False
+        return any(
+            name.startswith("segment-") for name in os.listdir(path)
+        )
+
+    def segments(self):
+        """
+        :return: The paths of all segments in the order they were written,
+                 including the segment that is currently written to
+        :rtype: list
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(StatisticsLogWriter.SEGMENT_SUFFIX) or \
+                    name.endswith(StatisticsLogWriter.SEGMENT_SUFFIX +
+                                  StatisticsLogWriter.PART_SUFFIX):
+                segments.append(name)
+        segments.sort()
+        return [os.path.join(self.directory, name) for name in segments]
+
+    def records(self):
+        """
+        Iterates over all records of the log. An incomplete last line, which
+        may be left behind if the writer was interrupted, is ignored
+        :return: The records as dictionaries
+        """
+        for segment in self.segments():
+            with open(segment, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    yield json.loads(line)
+
+    def read(self):
+        """
+        Reconstructs the statistics in the format of the JSON statistics
+        file, as loaded by json.load. Unlike the JSON statistics file, the
+        log contains every sample at full resolution.
+        :return: The statistics in the following format:
+                    {
+                        "flow_stats": {flow_id: {timestamp: {column: value}}},
+                        "overhead": {timestamp: overhead},
+                        "flow_info": {flow_id: flow_json},
+                        "algorithm": algorithm_name
+                    }
+        :rtype: dict
+        """
+        stats = {
+            "flow_stats": {},
+            "overhead": {},
+            "flow_info": {},
+            "algorithm": None
+        }
+
+        for record in self.records():
+            record_type = record.pop("type")
+
+            if record_type == "header":
+                stats["algorithm"] = record["algorithm"]
+
+            elif record_type == "flow":
+                stats["flow_info"][str(record["flow_id"])] = record
+
+            elif record_type == "flow_stats":
+                flow_id = str(record.pop("flow_id"))
+                timestamp = repr(record.pop("timestamp"))
+                if flow_id not in stats["flow_stats"]:
+                    stats["flow_stats"][flow_id] = {}
+                stats["flow_stats"][flow_id][timestamp] = record
+
+            elif record_type == "overhead":
+                timestamp = repr(record["timestamp"])
+                stats["overhead"][timestamp] = record["overhead"]
+
+        return stats
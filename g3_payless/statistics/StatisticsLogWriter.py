@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+
+
+class StatisticsLogWriter(object):
+    """
+    Writes statistics to an append-only log of newline-delimited JSON
+    records. Every write only appends the samples that were added since the
+    previous write, so the cost of a write does not grow with the length of
+    the run.
+    The log is a directory of numbered segments. The segment that is
+    currently written to carries the suffix .part and is renamed once it is
+    full, so complete segments never change after they appear.
+    """
+
+    SEGMENT_SUFFIX = ".ndjson"
+    """
+    The file extension of complete segments
+    """
+
+    PART_SUFFIX = ".part"
+    """
+    The additional file extension of the segment that is currently written to
+    """
+
+    def __init__(
+            self,
+            directory,
+            algorithm,
+            segment_size=64 * 1024 * 1024,
+            fsync_interval=60
+    ):
+        """
+        Initializes the writer. Segments of previous runs in the directory
+        are deleted
+        :param directory: The directory in which to store the segments
+        :type directory: str
+        :param algorithm: The name of the monitoring algorithm
+        :type algorithm: str
+        :param segment_size: The size in bytes after which a new segment is
+                             started
+        :type segment_size: int
+        :param fsync_interval: The minimum interval in seconds between
+                               syncing the current segment to disk
+        :type fsync_interval: float
+        """
+        self.directory = directory
+        self.algorithm = algorithm
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+
+        self.flow_cursors = {}
+        self.overhead_cursor = 0
+        self.written_flows = set()
+
+        self.segment = None
+        self.segment_index = 0
+        self.segment_bytes = 0
+        self.last_fsync = time.time()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in os.listdir(directory):
+            if name.endswith(self.SEGMENT_SUFFIX) \
+                    or name.endswith(self.SEGMENT_SUFFIX + self.PART_SUFFIX):
+                os.remove(os.path.join(directory, name))
+
+    def write(self, statistics, overhead_datapoints, flows):
+        """
+        Appends all flows, flow statistics and overhead datapoints that were
+        added since the previous write to the log.
+        Samples that were evicted from the time series' full resolution
+        before they could be written are skipped. The statistics may be a
+        snapshot that only contains the samples past flow_cursors, see
+        FlowStatistics.snapshot
+        :param statistics: The flow statistics
+        :type statistics: FlowStatistics
+        :param overhead_datapoints: The overhead datapoints
+        :type overhead_datapoints: TimeSeries
+        :param flows: The flows in the following format:
+                        {flow_id: Flow}
+        :type flows: Mapping
+        :return: The number of written records
+        :rtype: int
+        """
+        records = []
+
+        for flow_id, flow in flows.items():
+            if flow_id not in self.written_flows:
+                self.written_flows.add(flow_id)
+                record = flow.__json__()
+                record["type"] = "flow"
+                records.append(record)
+
+        for flow_id, series in statistics.items():
+            cursor = self.flow_cursors.get(flow_id, 0)
+            names = [name for name, _, _ in series.columns]
+            for sample in series.tail(series.appended - cursor):
+                record = dict(zip(names, sample))
+                record["type"] = "flow_stats"
+                record["flow_id"] = flow_id
+                records.append(record)
+            self.flow_cursors[flow_id] = series.appended
+
+        names = [name for name, _, _ in overhead_datapoints.columns]
+        new_overhead = overhead_datapoints.appended - self.overhead_cursor
+        for sample in overhead_datapoints.tail(new_overhead):
+            record = dict(zip(names, sample))
+            record["type"] = "overhead"
+            records.append(record)
+        self.overhead_cursor = overhead_datapoints.appended
+
+        self.append([
+            json.dumps(record, separators=(",", ":")) for record in records
+        ])
+        return len(records)
+
+    def forget(self, flow_ids):
+        """
+        Discards the cursors and the written state of flows that were
+        evicted from memory after their final statistics have been written
+        :param flow_ids: The IDs of the flows
+        :type flow_ids: list
+        :return: None
+        :rtype: None
+        """
+        for flow_id in flow_ids:
+            self.flow_cursors.pop(flow_id, None)
+            self.written_flows.discard(flow_id)
+
+    def append(self, lines):
+        """
+        Appends lines to the current segment, rotating the segment once it is
+        full and syncing it to disk periodically
+        :param lines: The lines to append
+        :type lines: list
+        :return: None
+        :rtype: None
+        """
+        if len(lines) == 0:
+            return
+
+        if self.segment is None:
+            self.open_segment()
+
+        data = "\n".join(lines) + "\n"
+        self.segment.write(data)
+        self.segment.flush()
+        self.segment_bytes += len(data)
+
+        if self.segment_bytes >= self.segment_size:
+            self.rotate()
+        elif time.time() - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.segment.fileno())
+            self.last_fsync = time.time()
+
+    def segment_path(self, index, complete):
+        """
+        :param index: The index of the segment
+        :type index: int
+        :param complete: Whether or not the segment is complete
+        :type complete: bool
+        :return: The path to the segment file
+        :rtype: str
+        """
+        name = "segment-{:06d}{}".format(index, self.SEGMENT_SUFFIX)
+        if not complete:
+            name += self.PART_SUFFIX
+        return os.path.join(self.directory, name)
+
+    def open_segment(self):
+        """
+        Starts a new segment, beginning with a header record
+        :return: None
+        :rtype: None
+        """
+        self.segment = open(self.segment_path(self.segment_index, False), "w")
+        self.segment_bytes = 0
+        header = {"type": "header", "algorithm": self.algorithm}
+        self.segment.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    def rotate(self):
+        """
+        Completes the current segment by syncing it to disk and atomically
+        renaming it
+        :return: None
+        :rtype: None
+        """
+        if self.segment is None:
+            return
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.segment.close()
+        os.rename(
+            self.segment_path(self.segment_index, False),
+            self.segment_path(self.segment_index, True)
+        )
+        self.segment = None
+        self.segment_index += 1
+        self.last_fsync = time.time()
+
+    def close(self):
+        """
+        Completes the current segment
+        :return: None
+        :rtype: None
+        """
+        self.rotate()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+from array import array
+
+
+class TimeSeries(object):
+    """
+    Bounded time series that stores its samples in compact typed columns.
+    The columns grow up to the retention limit and are then reused as a ring
+    buffer, evicting the oldest samples. If
+    downsampling is enabled, evicted samples are merged into coarser samples
+    which are kept in a second, equally bounded archive ring buffer.
+    """
+
+    FIRST = "first"
+    """
+    Aggregation that keeps the value of the first merged sample
+    """
+
+    LAST = "last"
+    """
+    Aggregation that keeps the value of the last merged sample
+    """
+
+    SUM = "sum"
+    """
+    Aggregation that adds up the values of the merged samples
+    """
+
+    def __init__(
+            self,
+            columns,
+            retention=3600,
+            downsampling=0,
+            archive_retention=3600
+    ):
+        """
+        Initializes the time series
+        :param columns: The columns of the time series as tuples consisting
+                        of the column name, the array typecode and the
+                        aggregation used when downsampling. The first column
+                        is used as the key of the samples
+        :type columns: list
+        :param retention: The number of samples kept at full resolution
+        :type retention: int
+        :param downsampling: The number of evicted samples to merge into a
+                             single archived sample. 0 disables archiving
+        :type downsampling: int
+        :param archive_retention: The number of archived samples to keep
+        :type archive_retention: int
+        """
+        self.columns = columns
+        self.retention = retention
+        self.data = [array(typecode) for _, typecode, _ in columns]
+        self.start = 0
+        self.size = 0
+        self.appended = 0
+
+        self.downsampling = downsampling
+        self.pending = None
+        self.pending_count = 0
+        if downsampling > 0:
+            self.archive = TimeSeries(columns, archive_retention)
+        else:
+            self.archive = None
+
+    def __len__(self):
+        """
+        :return: The number of samples, including archived samples
+        :rtype: int
+        """
+        if self.archive is None:
+            return self.size
+        pending = 0 if self.pending is None else 1
+        return self.size + pending + len(self.archive)
+
+    def append(self, *values):
+        """
+        Appends a sample to the time series, evicting the oldest sample if
+        the time series is full
+        :param values: The values of the sample, one per column. Integer
+                       columns only accept integers
+        :type values: list
+        :return: None
+        :rtype: None
+        """
+        index = self.reserve()
+        if index is None:
+            return
+        for column, value in zip(self.data, values):
+            column[index] = value
+
+    def reserve(self):
+        """
+        Reserves the slot of the next sample in the columns, evicting the
+        oldest sample if the time series is full. The columns are allocated
+        in growing blocks up to the retention limit, so callers can write
+        the values of the sample directly into the columns
+        :return: The index of the slot, or None if nothing is retained
+        :rtype: int
+        """
+        self.appended += 1
+        if self.size < self.retention:
+            index = self.size
+            if index == len(self.data[0]):
+                self.grow()
+            self.size += 1
+            return index
+        elif self.retention <= 0:
+            return None
+
+        if self.archive is not None:
+            self.evict(self.get(0))
+        index = self.start
+        self.start = (self.start + 1) % self.retention
+        return index
+
+    def grow(self):
+        """
+        Doubles the allocated size of the columns, up to the retention limit
+        :return: None
+        :rtype: None
+        """
+        capacity = min(max(2 * len(self.data[0]), 16), self.retention)
+        for column in self.data:
+            column.extend(
+                array(column.typecode, [0]) * (capacity - len(column))
+            )
+
+    def evict(self, sample):
+        """
+        Merges an evicted sample into the pending downsampled sample and moves
+        the pending sample into the archive once it is complete
+        :param sample: The evicted sample
+        :type sample: tuple
+        :return: None
+        :rtype: None
+        """
+        if self.archive is None:
+            return
+
+        if self.pending is None:
+            self.pending = list(sample)
+        else:
+            for i, (_, _, aggregation) in enumerate(self.columns):
+                if aggregation == TimeSeries.LAST:
+                    self.pending[i] = sample[i]
+                elif aggregation == TimeSeries.SUM:
+                    self.pending[i] += sample[i]
+        self.pending_count += 1
+
+        if self.pending_count == self.downsampling:
+            self.archive.append(*self.pending)
+            self.pending = None
+            self.pending_count = 0
+
+    def get(self, position):
+        """
+        Retrieves a sample that is stored at full resolution
+        :param position: The position of the sample, 0 being the oldest
+        :type position: int
+        :return: The values of the sample
+        :rtype: tuple
+        """
+        index = (self.start + position) % self.retention
+        return tuple(column[index] for column in self.data)
+
+    def snapshot(self):
+        """
+        Creates a copy of the time series that is not affected by later
+        changes. The time series must not be modified while it is copied
+        :return: The copy
+        :rtype: TimeSeries
+        """
+        copy = TimeSeries(self.columns, self.retention, 0)
+        copy.data = [column[:self.size] for column in self.data]
+        copy.start = self.start
+        copy.size = self.size
+        copy.appended = self.appended
+        copy.downsampling = self.downsampling
+        copy.pending = None if self.pending is None else list(self.pending)
+        copy.pending_count = self.pending_count
+        copy.archive = None if self.archive is None \
+            else self.archive.snapshot()
+        return copy
+
+    def tail_snapshot(self, cursor):
+        """
+        Creates a copy of the time series that only contains the samples at
+        full resolution which were appended after a cursor, so consumers
+        that keep a cursor don't have to copy the whole time series.
+        The time series must not be modified while it is copied
+        :param cursor: The value of the appended counter up to which the
+                       samples were already consumed
+        :type cursor: int
+        :return: The copy, whose appended counter equals this one's
+        :rtype: TimeSeries
+        """
+        count = min(self.appended - cursor, self.size)
+        copy = TimeSeries(self.columns, max(count, 1), 0)
+        copy.appended = self.appended
+        if count <= 0:
+            return copy
+
+        first = (self.start + self.size - count) % self.retention
+        end = first + count
+        for index, column in enumerate(self.data):
+            if end <= len(column):
+                copy.data[index] = column[first:end]
+            else:
+                copy.data[index] = column[first:] + column[:end - len(column)]
+        copy.size = count
+        return copy
+
+    def tail(self, count):
+        """
+        Retrieves the most recent samples that are stored at full resolution.
+        Together with the appended counter, this allows consumers to keep a
+        cursor and only process samples they haven't seen yet
+        :param count: The maximum number of samples to retrieve
+        :type count: int
+        :return: The samples as tuples in chronological order
+        :rtype: list
+        """
+        count = min(count, self.size)
+        return [
+            self.get(position)
+            for position in range(self.size - count, self.size)
+        ]
+
+    def __iter__(self):
+        """
+        Iterates over all samples in chronological order, starting with the
+        archived samples and the partially downsampled sample
+        :return: The samples as tuples
+        """
+        if self.archive is not None:
+            for sample in self.archive:
+                yield sample
+        if self.pending is not None:
+            yield tuple(self.pending)
+        for position in range(0, self.size):
+            yield self.get(position)
+
+    def __json__(self):
+        """
+        :return: A dictionary representation of the time series in the
+                 following format:
+                    {key: value} if the time series only has one value column
+                    {key: {column: value}} otherwise
+        :rtype: dict
+        """
+        names = [name for name, _, _ in self.columns[1:]]
+        if len(names) == 1:
+            return {sample[0]: sample[1] for sample in self}
+        return {
+            sample[0]: dict(zip(names, sample[1:]))
+            for sample in self
+        }
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import zipfile
+# noinspection PyPackageRequirements
+import numpy
+from g3_payless.visualization.stats_file import ARCHIVE_SUFFIX
+
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(
+    os.path.expanduser("~"), ".cache", "g3-payless"
+)
+"""
+The directory in which preprocessed statistics are cached by default
+"""
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+"""
+The default maximum size of the cache in bytes
+"""
+
+CACHE_VERSION = 2
+"""
+Part of every cache key, needs to be increased whenever the format or the
+meaning of cached arrays changes
+"""
+
+
+def file_hash(path):
+    """
+    Calculates the SHA-1 hash of the content of a statistics file. For
+    statistics directories, the relative paths and contents of all files
+    are hashed, JSON statistics files are hashed together with their
+    archived flows
+    :param path: The path to the file or directory
+    :type path: str
+    :return: The hex digest
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+
+    if os.path.isdir(path):
+        files = []
+        for root, _, names in os.walk(path):
+            for name in names:
+                files.append(os.path.relpath(os.path.join(root, name), path))
+        files = [(name, os.path.join(path, name)) for name in sorted(files)]
+    else:
+        files = [("", path)]
+        if os.path.isfile(path + ARCHIVE_SUFFIX):
+            files.append((ARCHIVE_SUFFIX, path + ARCHIVE_SUFFIX))
+
+    for name, file_path in files:
+        digest.update(name.encode("utf-8"))
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cache_key(stats_file, kind, *parameters):
+    """
+    Builds the cache key of preprocessed data of a statistics file
+    :param stats_file: The path to the statistics file or directory
+    :type stats_file: str
+    :param kind: The kind of the preprocessed data
+    :type kind: str
+    :param parameters: The parameters the preprocessing depends on
+    :return: The cache key
+    :rtype: str
+    """
+    return "-".join(
+        [kind, "v{}".format(CACHE_VERSION), file_hash(stats_file)]
+        + [str(parameter) for parameter in parameters]
+    )
+
+
+def load_cached(cache_directory, key):
+    """
+    Loads arrays from the cache and marks them as recently used.
+    Missing or unreadable entries are treated as cache misses
+    :param cache_directory: The cache directory
+    :type cache_directory: str
+    :param key: The cache key
+    :type key: str
+    :return: The arrays by name or None if they are not cached
+    :rtype: dict
+    """
+    path = os.path.join(cache_directory, key + ".npz")
+    try:
+        with numpy.load(path) as cached:
+            arrays = {name: cached[name] for name in cached.files}
+        os.utime(path, None)
+        return arrays
+    except (IOError, OSError, ValueError, zipfile.BadZipfile):
+        return None
+
+
+def store_cached(cache_directory, key, arrays, max_size):
+    """
+    Atomically stores arrays in the cache, then evicts the least recently
+    used entries until the cache fits into its maximum size
+    :param cache_directory: The cache directory
+    :type cache_directory: str
+    :param key: The cache key
+    :type key: str
+    :param arrays: The arrays by name
+    :type arrays: dict
+    :param max_size: The maximum size of the cache in bytes
+    :type max_size: int
+    :return: None
+    :rtype: None
+    """
+    if not os.path.isdir(cache_directory):
+        try:
+            os.makedirs(cache_directory)
+        except OSError:  # Created by another process in the meantime
+            pass
+
+    path = os.path.join(cache_directory, key + ".npz")
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as f:
+        numpy.savez(f, **arrays)
+    os.rename(temp_path, path)
+
+    evict(cache_directory, max_size)
+
+
+def evict(cache_directory, max_size):
+    """
+    Deletes the least recently used cache entries until the total size of
+    the cache does not exceed the maximum size
+    :param cache_directory: The cache directory
+    :type cache_directory: str
+    :param max_size: The maximum size of the cache in bytes
+    :type max_size: int
+    :return: None
+    :rtype: None
+    """
+    entries = []
+    for name in os.listdir(cache_directory):
+        if not name.endswith(".npz"):
+            continue
+        path = os.path.join(cache_directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:  # Evicted by another process
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def encode_json(data):
+    """
+    Encodes JSON-serializable data as an array, so it can be cached
+    alongside numeric arrays
+    :param data: The data
+    :type data: object
+    :return: The encoded data
+    :rtype: numpy.ndarray
+    """
+    return numpy.frombuffer(
+        json.dumps(data).encode("utf-8"), dtype=numpy.uint8
+    )
+
+
+def decode_json(array):
+    """
+    Decodes data encoded by encode_json
+    :param array: The encoded data
+    :type array: numpy.ndarray
+    :return: The data
+    :rtype: object
+    """
+    return json.loads(array.tobytes().decode("utf-8"))
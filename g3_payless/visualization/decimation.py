@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# noinspection PyPackageRequirements
+import numpy
+
+
+def decimate(x_data, y_data, pixels):
+    """
+    Reduces a series to at most four points per pixel column while
+    preserving its peaks. For every column, the first, last, lowest and
+    highest points are kept, so the rendered lines look the same as with all
+    points and the rendering time no longer depends on the length of the
+    series
+    :param x_data: The x values, sorted in ascending order
+    :type x_data: Sequence
+    :param y_data: The y values
+    :type y_data: Sequence
+    :param pixels: The number of pixel columns the series is drawn on
+    :type pixels: int
+    :return: The decimated x and y values as arrays
+    :rtype: tuple
+    """
+    x_data = numpy.asarray(x_data)
+    y_data = numpy.asarray(y_data)
+    if len(x_data) <= 4 * pixels or x_data[-1] == x_data[0]:
+        return x_data, y_data
+
+    columns = ((x_data - x_data[0]) * pixels // (x_data[-1] - x_data[0]))
+    columns = numpy.minimum(columns.astype(numpy.int64), pixels - 1)
+
+    first = numpy.flatnonzero(numpy.diff(columns, prepend=-1))
+    last = numpy.append(first[1:] - 1, len(columns) - 1)
+
+    order = numpy.lexsort((y_data, columns))
+    lowest = order[first]
+    highest = order[last]
+
+    kept = numpy.unique(numpy.concatenate((first, last, lowest, highest)))
+    return x_data[kept], y_data[kept]
+
+
+def figure_pixels(figure, dpi=None):
+    """
+    :param figure: The matplotlib figure
+    :type figure: matplotlib.figure.Figure
+    :param dpi: The resolution the figure is rendered with, defaults to the
+                resolution of the figure
+    :type dpi: int
+    :return: The width of the figure in pixels
+    :rtype: int
+    """
+    if dpi is None:
+        dpi = figure.dpi
+    return int(figure.get_figwidth() * dpi)
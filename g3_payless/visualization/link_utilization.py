@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
-import os
-import json
+from functools import partial
 # noinspection PyPackageRequirements
 import matplotlib
+# noinspection PyPackageRequirements
+import numpy
 from g3_payless.monitoring.PaylessMultiThread import PaylessMultiThread
 from g3_payless.monitoring.PeriodicPollingPerFlow import PeriodicPollingPerFlow
 from g3_payless.monitoring.FlowSense import FlowSense
+from g3_payless.visualization.stats_file import read_flow_samples
+from g3_payless.visualization.cache import DEFAULT_CACHE_DIRECTORY, \
+    DEFAULT_CACHE_SIZE
+from g3_payless.visualization.decimation import decimate, figure_pixels
+from g3_payless.visualization.parallel import parallel_map
+from g3_payless.visualization.vectorized import load_aggregated, \
+    aggregate_bins, fill_bins
 
 
 def show_flow_stats(
@@ -14,7 +22,12 @@ def show_flow_stats(
         only_ipv4_flows,
         smoothen_factor=1000,
         out_file=None,
-        default_style=False
+        default_style=False,
+        aggregation="median",
+        workers=None,
+        cache_directory=DEFAULT_CACHE_DIRECTORY,
+        cache_size=DEFAULT_CACHE_SIZE,
+        decimation=True
 ):
     """
     Visualizes link utilization using matplotlib
@@ -28,11 +41,28 @@ def show_flow_stats(
     :type flow_stats_files: str
     :param only_ipv4_flows: Whether or not to only check ipv4-matched flows
     :type only_ipv4_flows: bool
-    :param smoothen_factor: Averages (using the median value) the values in the
-                            specified time interval in milliseconds
+    :param smoothen_factor: Aggregates the values in the specified time
+                            interval in milliseconds
     :type smoothen_factor: int
     :param out_file: Optional file in which to store the generated graph
     :type out_file: str
+    :param default_style: Whether or not to use matplotlib's default colors
+                          and line styles
+    :type default_style: bool
+    :param aggregation: The aggregation of the values of a time interval,
+                        see vectorized.AGGREGATIONS
+    :type aggregation: str
+    :param workers: The number of processes loading the files in parallel,
+                    defaults to the number of CPUs
+    :type workers: int
+    :param cache_directory: The directory in which to cache the normalized
+                            per-flow runs, None disables the cache
+    :type cache_directory: str
+    :param cache_size: The maximum size of the cache in bytes
+    :type cache_size: int
+    :param decimation: Whether or not to reduce the series to the points
+                       that are visible at the resolution of the graph
+    :type decimation: bool
     :return: None
     :rtype: None
     """
@@ -47,40 +77,52 @@ def show_flow_stats(
         FlowSense.name(): "dashdot"
     }
 
+    titles = {
+        "per-flow": "Per-Flow Link Utilization",
+        "per-ipv4": "Per-IPv4-Match Link Utilization",
+        "total": "Total Link Utilization"
+    }
+    if mode not in titles:
+        print("Invalid Mode")
+        return
+    title = titles[mode]
+
+    # The per-millisecond dictionaries of load_stats don't scale to long
+    # runs with many flows, so the vectorized equivalents are used.
+    # The files are processed before matplotlib is set up, so the worker
+    # processes don't inherit its state
+    loaded = parallel_map(
+        partial(
+            load_aggregated,
+            mode=mode,
+            only_ipv4_flows=only_ipv4_flows,
+            smoothen_factor=smoothen_factor,
+            aggregation=aggregation,
+            cache_directory=cache_directory,
+            cache_size=cache_size
+        ),
+        flow_stats_files,
+        workers
+    )
+    aggregated = {}
+    algos = {}
+    for file_aggregated, algo in loaded:
+        aggregated.update(file_aggregated)
+        for identifier in file_aggregated:
+            algos[identifier] = algo
+    to_visualize = fill_bins(aggregated)
+
     if out_file is not None:
         matplotlib.use("Agg")
     # noinspection PyPackageRequirements
     from matplotlib import pyplot
     figure = pyplot.figure(figsize=(7, 5))
+    pixels = figure_pixels(figure, None if out_file is None else 300)
 
-    file_stats = {}
-    algos = {}
-    for _file in flow_stats_files:
-        file_identifier = os.path.basename(_file).rsplit(".", 1)[0]
-        stats, algo = load_stats(_file, only_ipv4_flows)
-        stats = normalize_timestamps(stats)
-        file_stats[file_identifier] = stats
-        algos[file_identifier] = algo
-
-    if mode == "per-flow":
-        calculated_stats = calculate_per_flow_stats(file_stats)
-        title = "Per-Flow Link Utilization"
-    elif mode == "per-ipv4":
-        calculated_stats = calculate_per_ipv4_match_stats(file_stats)
-        title = "Per-IPv4-Match Link Utilization"
-    elif mode == "total":
-        calculated_stats = calculate_total_link_utilization(file_stats)
-        title = "Total Link Utilization"
-    else:
-        print("Invalid Mode")
-        return
-
-    to_visualize = prepare_stats(calculated_stats, smoothen_factor)
-
-    for identifier, datapoints in to_visualize.items():
+    for identifier, (x_data, y_data) in to_visualize.items():
+        if decimation:
+            x_data, y_data = decimate(x_data, y_data, pixels)
         algo = algos[identifier]
-        x_data = [point[0] for point in datapoints]
-        y_data = [point[1] for point in datapoints]
 
         if algo in colors and algo in line_styles and not default_style:
             color = colors[algo]
@@ -110,7 +152,7 @@ def show_flow_stats(
 def load_stats(flow_stats_file, only_ipv4_flows):
     """
     Loads raw stats from a stats file
-    :param flow_stats_file: The stats file to read
+    :param flow_stats_file: The stats file or directory to read
     :type flow_stats_file: str
     :param only_ipv4_flows: Whether or not to include only ipv4 flows or not
     :type only_ipv4_flows: bool
@@ -120,15 +162,10 @@ def load_stats(flow_stats_file, only_ipv4_flows):
     :rtype: tuplr
     """
 
-    with open(flow_stats_file) as f:
-        all_stats = json.load(f)
-
-    flow_stats = all_stats["flow_stats"]
-    flow_info = all_stats["flow_info"]
+    flows, algorithm = read_flow_samples(flow_stats_file)
     stats = {}
 
-    for flow_id, datapoints in flow_stats.items():
-        flow = flow_info[flow_id]
+    for flow_id, flow, samples in flows:
         ipv4_src = flow["ipv4_src"]
         ipv4_dst = flow["ipv4_dst"]
 
@@ -137,10 +174,7 @@ def load_stats(flow_stats_file, only_ipv4_flows):
 
         recorded = {}
 
-        for timestamp, details in datapoints.items():
-            flow_bytes = details["bytes"]
-            flow_duration = details["duration"]
-            end_millisecond = int(float(timestamp) * 1000)
+        for end_millisecond, flow_bytes, flow_duration in samples:
             start_millisecond = end_millisecond - flow_duration
             milliseconds = list(range(start_millisecond, end_millisecond))
 
@@ -160,7 +194,7 @@ def load_stats(flow_stats_file, only_ipv4_flows):
             "data": recorded
         }
 
-    return stats, all_stats.get("algorithm")
+    return stats, algorithm
 
 
 def calculate_per_flow_stats(file_stats):
@@ -235,7 +269,7 @@ def calculate_total_link_utilization(file_stats):
     return total_stats
 
 
-def prepare_stats(calculated_stats, smoothen_factor):
+def prepare_stats(calculated_stats, smoothen_factor, aggregation="median"):
     """
     Smooths out the calculated statistics and prepares them for
     visualization.
@@ -244,42 +278,39 @@ def prepare_stats(calculated_stats, smoothen_factor):
     :param smoothen_factor: The length of the interval to which to smoothen
                             the data
     :type smoothen_factor: int
+    :param aggregation: The aggregation of the values of an interval, see
+                        vectorized.AGGREGATIONS
+    :type aggregation: str
     :return: The prepared statistics in the following format:
                 {label: [(timestamp, bytes)]}
     :rtype: dict
     """
-    prepared = {}
-    maximum_timestamp = 0
+    aggregated = {}
 
     for identifier, datapoints in calculated_stats.items():
-        prepared[identifier] = []
-
-        collected = {}
-
-        for millisecond, byte_count in datapoints.items():
-            new_timestamp = int(millisecond / smoothen_factor)
-
-            if new_timestamp > maximum_timestamp:
-                maximum_timestamp = new_timestamp
-
-            if new_timestamp not in collected:
-                collected[new_timestamp] = []
-            collected[new_timestamp].append(byte_count)
-
-        for new_timestamp, values in collected.items():
-            value = sorted(values)[int(len(values) / 2)]  # median
-            prepared[identifier].append((new_timestamp, value))
-
-    for identifier in prepared:
-
-        nonzero_timestamps = [x[0] for x in prepared[identifier]]
-        for timestamp in range(0, maximum_timestamp):
-            if timestamp not in nonzero_timestamps:
-                prepared[identifier].append((timestamp, 0))
-
-        prepared[identifier].sort(key=lambda x: x[0])
-
-    return prepared
+        milliseconds = numpy.fromiter(
+            datapoints.keys(), dtype=numpy.int64, count=len(datapoints)
+        )
+        byte_counts = numpy.fromiter(
+            datapoints.values(), dtype=numpy.int64, count=len(datapoints)
+        )
+
+        # Truncates towards zero like int(millisecond / smoothen_factor)
+        bins = numpy.abs(milliseconds) // smoothen_factor
+        bins = numpy.where(milliseconds < 0, -bins, bins)
+
+        order = numpy.lexsort((byte_counts, bins))
+        aggregated[identifier] = aggregate_bins(
+            bins[order],
+            byte_counts[order],
+            numpy.ones(len(bins), dtype=numpy.int64),
+            aggregation
+        )
+
+    return {
+        identifier: list(zip(timestamps.tolist(), values.tolist()))
+        for identifier, (timestamps, values) in fill_bins(aggregated).items()
+    }
 
 
 def normalize_timestamps(stats):
@@ -1,12 +1,29 @@
 import os
-import json
+from functools import partial
 # noinspection PyPackageRequirements
 import matplotlib
+# noinspection PyPackageRequirements
+import numpy
 from g3_payless.monitoring.PaylessMultiThread import PaylessMultiThread
 from g3_payless.monitoring.PeriodicPollingPerFlow import PeriodicPollingPerFlow
+from g3_payless.visualization.cache import cache_key, load_cached, \
+    store_cached, encode_json, decode_json, DEFAULT_CACHE_DIRECTORY, \
+    DEFAULT_CACHE_SIZE
+from g3_payless.visualization.decimation import decimate, figure_pixels
+from g3_payless.visualization.parallel import parallel_map
+from g3_payless.visualization.stats_file import read_overhead
 
 
-def show_overhead_stats(mode, stats_files, out_file, default_style =False):
+def show_overhead_stats(
+        mode,
+        stats_files,
+        out_file,
+        default_style=False,
+        workers=None,
+        cache_directory=DEFAULT_CACHE_DIRECTORY,
+        cache_size=DEFAULT_CACHE_SIZE,
+        decimation=True
+):
     """
     Visualizes overhead statistics using matplotlib
     :param mode: The mode in which to visualize the data
@@ -18,13 +35,45 @@ def show_overhead_stats(mode, stats_files, out_file, default_style =False):
     :type stats_files: list
     :param out_file: Optional file in which to store the generated graph
     :type out_file: str
+    :param default_style: Whether or not to use matplotlib's default colors
+                          and line styles
+    :type default_style: bool
+    :param workers: The number of processes loading the files in parallel,
+                    defaults to the number of CPUs
+    :type workers: int
+    :param cache_directory: The directory in which to cache the normalized
+                            overhead, None disables the cache
+    :type cache_directory: str
+    :param cache_size: The maximum size of the cache in bytes
+    :type cache_size: int
+    :param decimation: Whether or not to reduce the series to the points
+                       that are visible at the resolution of the graph
+    :type decimation: bool
     :return: None
     """
+    # Loaded before matplotlib is set up, see show_flow_stats
+    loaded = parallel_map(
+        partial(
+            load_overhead,
+            cache_directory=cache_directory,
+            cache_size=cache_size
+        ),
+        stats_files,
+        workers
+    )
+    stats = {}
+    algos = {}
+    for stats_file, (timestamps, values, algo) in zip(stats_files, loaded):
+        file_id = os.path.basename(stats_file).rsplit(".", 1)[0]
+        stats[file_id] = (timestamps, values)
+        algos[file_id] = algo
+
     if out_file is not None:
         matplotlib.use("Agg")
     # noinspection PyPackageRequirements
     from matplotlib import pyplot
     figure = pyplot.figure(figsize=(10, 7))
+    pixels = figure_pixels(figure, None if out_file is None else 300)
 
     colors = {
         PaylessMultiThread.name(): "red",
@@ -35,15 +84,6 @@ def show_overhead_stats(mode, stats_files, out_file, default_style =False):
         PeriodicPollingPerFlow.name(): "dotted"
     }
 
-    stats = {}
-    algos = {}
-    for stats_file in stats_files:
-        with open(stats_file) as f:
-            file_stats = json.load(f)
-        file_id = os.path.basename(stats_file).rsplit(".", 1)[0]
-        stats[file_id] = normalize(file_stats["overhead"])
-        algos[file_id] = file_stats["algorithm"]
-
     if mode == "cummulative":
         to_display = cummulative(stats)
     elif mode == "relative":
@@ -52,10 +92,10 @@ def show_overhead_stats(mode, stats_files, out_file, default_style =False):
         print("Invalid mode")
         return
 
-    for file_id, datapoints in to_display.items():
+    for file_id, (x_data, y_data) in to_display.items():
+        if decimation:
+            x_data, y_data = decimate(x_data, y_data, pixels)
         algo = algos[file_id]
-        x_data = [point[0] for point in datapoints]
-        y_data = [point[1] for point in datapoints]
 
         if algo in colors and algo in line_styles and not default_style:
             color = colors[algo]
@@ -82,6 +122,50 @@ def show_overhead_stats(mode, stats_files, out_file, default_style =False):
     pyplot.close()
 
 
+def load_overhead(
+        stats_file,
+        cache_directory=None,
+        cache_size=DEFAULT_CACHE_SIZE
+):
+    """
+    Loads and normalizes the overhead of a statistics file. Used by worker
+    processes, whose results have to be pickled. The result is cached by
+    the hash of the file's content
+    :param stats_file: The statistics file or directory
+    :type stats_file: str
+    :param cache_directory: The cache directory, None disables the cache
+    :type cache_directory: str
+    :param cache_size: The maximum size of the cache in bytes
+    :type cache_size: int
+    :return: A tuple consisting of the normalized timestamps and the
+             overhead values as arrays as well as the name of the algorithm
+    :rtype: tuple
+    """
+    if cache_directory is not None:
+        key = cache_key(stats_file, "overhead")
+        cached = load_cached(cache_directory, key)
+        if cached is not None:
+            return (
+                cached["timestamps"],
+                cached["values"],
+                decode_json(cached["algorithm"])
+            )
+
+    overhead, algorithm = read_overhead(stats_file)
+    normalized = normalize(overhead)
+    timestamps = numpy.array(list(normalized.keys()), dtype=numpy.int64)
+    values = numpy.array(list(normalized.values()))
+
+    if cache_directory is not None:
+        # noinspection PyUnboundLocalVariable
+        store_cached(cache_directory, key, {
+            "timestamps": timestamps,
+            "values": values,
+            "algorithm": encode_json(algorithm)
+        }, cache_size)
+    return timestamps, values, algorithm
+
+
 def normalize(stats):
     """
     Normalizes the timestamps in the statistics
@@ -101,32 +185,25 @@ def normalize(stats):
 def cummulative(stats):
     """
     Calculates cummulative overhead stats
-    :param stats: The statistics
+    :param stats: The statistics in the following format:
+                    {file_id: (timestamps, values)}
     :type stats: dict
-    :return: The cummulative statistics
+    :return: The cummulative statistics in the same format
     :rtype: dict
     """
-    return {
-        file_id: [(x, y) for x, y in datapoints.items()]
-        for file_id, datapoints in stats.items()
-    }
+    return dict(stats)
 
 
 def relative(stats):
     """
     Calculates relative overhead stats
-    :param stats: The statistics
+    :param stats: The statistics in the following format:
+                    {file_id: (timestamps, values)}
     :type stats: dict
-    :return: The relative statistics
+    :return: The relative statistics in the same format
     :rtype: dict
     """
-    relative_stats = {}
-    for file_id, datapoints in stats.items():
-        relative_stats[file_id] = []
-        previous = 0
-        for timestamp, value in datapoints.items():
-            delta = value - previous
-            relative_stats[file_id].append((timestamp, delta))
-            previous = value
-
-    return relative_stats
+    return {
+        file_id: (timestamps, numpy.diff(values, prepend=0))
+        for file_id, (timestamps, values) in stats.items()
+    }
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+
+
+def parallel_map(function, arguments, workers=None):
+    """
+    Applies a function to every argument using a pool of worker processes.
+    The function and its results have to be picklable, so results should be
+    kept compact, for example as numpy arrays instead of nested dictionaries
+    :param function: The function to apply, defined at module level
+    :type function: callable
+    :param arguments: The arguments
+    :type arguments: list
+    :param workers: The number of worker processes. Defaults to the number
+                    of CPUs. With a single worker, the function is applied
+                    in the current process
+    :type workers: int
+    :return: The results in the order of the arguments
+    :rtype: list
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(arguments))
+
+    if workers <= 1:
+        return [function(argument) for argument in arguments]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(function, arguments, chunksize=1)
+    finally:
+        # All results have been collected or an error occurred, so the
+        # workers can be stopped right away
+        pool.terminate()
+        pool.join()
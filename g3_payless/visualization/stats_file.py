@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import json
+# noinspection PyPackageRequirements
+import numpy
+from g3_payless.statistics.StatisticsLogReader import StatisticsLogReader
+from g3_payless.statistics.ColumnarStatisticsReader import \
+    ColumnarStatisticsReader
+
+
+ARCHIVE_SUFFIX = ".flows"
+"""
+The suffix of the file next to a JSON statistics file that contains the
+flows which were evicted from memory after their removal
+"""
+
+
+def read_stats(stats_file):
+    """
+    Reads a statistics file, which may either be a JSON statistics file,
+    a statistics log directory or a columnar statistics directory.
+    The archived flows of JSON statistics files are merged into their
+    flow info and flow statistics
+    :param stats_file: The path to the statistics file or directory
+    :type stats_file: str
+    :return: The statistics in the format of the JSON statistics file
+    :rtype: dict
+    """
+    if ColumnarStatisticsReader.is_columnar(stats_file):
+        return ColumnarStatisticsReader(stats_file).read()
+    if StatisticsLogReader.is_log(stats_file):
+        return StatisticsLogReader(stats_file).read()
+    with open(stats_file) as f:
+        stats = json.load(f)
+    flow_info, flow_stats = read_archived_flows(stats_file + ARCHIVE_SUFFIX)
+    stats["flow_info"].update(flow_info)
+    stats["flow_stats"].update(flow_stats)
+    return stats
+
+
+def read_archived_flows(archive_file):
+    """
+    Reads the archived flows and their statistics, one flow per line
+    :param archive_file: The path to the archive file
+    :type archive_file: str
+    :return: A tuple consisting of:
+                * The flow info in the following format:
+                    {flow_id: flow_json}
+                * The flow statistics in the following format:
+                    {flow_id: {timestamp: {column: value}}}
+    :rtype: tuple
+    """
+    flow_info = {}
+    flow_stats = {}
+    try:
+        with open(archive_file, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):  # Interrupted while archiving
+                    break
+                archived = json.loads(line)
+                flow_id = str(archived["flow_info"]["flow_id"])
+                flow_info[flow_id] = archived["flow_info"]
+                if len(archived["flow_stats"]) > 0:
+                    flow_stats[flow_id] = archived["flow_stats"]
+    except IOError:
+        pass
+    return flow_info, flow_stats
+
+
+def read_overhead(stats_file):
+    """
+    Reads the overhead datapoints of a statistics file or directory without
+    reconstructing the flow statistics of columnar statistics
+    :param stats_file: The path to the statistics file or directory
+    :type stats_file: str
+    :return: A tuple consisting of:
+                * The overhead in the following format:
+                    {timestamp: overhead}
+                * The name of the algorithm
+    :rtype: tuple
+    """
+    if ColumnarStatisticsReader.is_columnar(stats_file):
+        reader = ColumnarStatisticsReader(stats_file)
+        overhead = {
+            repr(timestamp_ms / 1000.0): value
+            for timestamp_ms, value in reader.overhead().tolist()
+        }
+        return overhead, reader.algorithm
+
+    all_stats = read_stats(stats_file)
+    return all_stats["overhead"], all_stats["algorithm"]
+
+
+def read_flow_samples(stats_file, as_arrays=False):
+    """
+    Reads the samples of every flow from a statistics file or directory.
+    Columnar statistics are memory-mapped and converted one flow at a time
+    instead of being loaded as a whole.
+    :param stats_file: The path to the statistics file or directory
+    :type stats_file: str
+    :param as_arrays: Whether to return the samples of a flow as an
+                      int64 numpy array with one row per sample instead
+                      of a list of tuples
+    :type as_arrays: bool
+    :return: A tuple consisting of:
+                * A generator yielding tuples of the flow ID, the flow info
+                  and the flow's samples, consisting of the timestamp in
+                  milliseconds, the byte count and the duration
+                * The name of the algorithm
+    :rtype: tuple
+    """
+    if ColumnarStatisticsReader.is_columnar(stats_file):
+        reader = ColumnarStatisticsReader(stats_file)
+
+        def columnar_flows():
+            for flow_id in reader.flow_ids():
+                samples = reader.flow_samples(flow_id)
+                if len(samples) == 0:
+                    continue
+                if as_arrays:
+                    samples = samples.view("<i8").reshape(-1, 3)
+                else:
+                    samples = samples.tolist()
+                yield flow_id, reader.flow_info[flow_id], samples
+
+        return columnar_flows(), reader.algorithm
+
+    all_stats = read_stats(stats_file)
+    flow_info = all_stats["flow_info"]
+
+    def json_flows():
+        for flow_id, datapoints in all_stats["flow_stats"].items():
+            samples = [
+                (
+                    int(float(timestamp) * 1000),
+                    details["bytes"],
+                    details["duration"]
+                )
+                for timestamp, details in datapoints.items()
+            ]
+            if as_arrays:
+                samples = numpy.array(samples, dtype=numpy.int64) \
+                    .reshape(-1, 3)
+            yield flow_id, flow_info[flow_id], samples
+
+    return json_flows(), all_stats.get("algorithm")
@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy implementation of the link utilization calculations of the
+link_utilization module.
+Instead of a dictionary entry per millisecond, the utilization of a flow is
+represented by runs, a tuple of three int64 arrays holding the start
+millisecond, the end millisecond (exclusive) and the bytes per millisecond
+of non-overlapping intervals sorted by their start. Milliseconds that are
+not covered by any run have no value, which is different from a value of 0.
+The results are identical to the ones of the dictionary-based functions.
+"""
+import os
+# noinspection PyPackageRequirements
+import numpy
+from g3_payless.visualization.stats_file import read_flow_samples
+from g3_payless.visualization.cache import cache_key, load_cached, \
+    store_cached, encode_json, decode_json, DEFAULT_CACHE_SIZE
+
+
+AGGREGATIONS = ("median", "mean", "max", "p95")
+"""
+The supported aggregations of the values within a smoothing interval
+"""
+
+
+def empty_runs():
+    """
+    :return: Runs that do not cover any millisecond
+    :rtype: tuple
+    """
+    return (
+        numpy.zeros(0, dtype=numpy.int64),
+        numpy.zeros(0, dtype=numpy.int64),
+        numpy.zeros(0, dtype=numpy.int64)
+    )
+
+
+def load_runs(flow_stats_file, only_ipv4_flows):
+    """
+    Loads the runs of every flow in a stats file
+    :param flow_stats_file: The stats file or directory to read
+    :type flow_stats_file: str
+    :param only_ipv4_flows: Whether or not to include only ipv4 flows or not
+    :type only_ipv4_flows: bool
+    :return: The runs in the following format:
+                {flow_id: {info: {...}, runs: runs}}
+             as well as the name of the algorithm as second part of the tuple
+    :rtype: tuple
+    """
+    flows, algorithm = read_flow_samples(flow_stats_file, as_arrays=True)
+    stats = {}
+
+    for flow_id, flow, samples in flows:
+        if only_ipv4_flows and \
+                flow["ipv4_dst"] is None and flow["ipv4_src"] is None:
+            continue
+
+        stats[flow_id] = {
+            "info": flow,
+            "runs": paint_samples(samples[:, 0], samples[:, 1], samples[:, 2])
+        }
+
+    return stats, algorithm
+
+
+def load_normalized_runs(
+        flow_stats_file,
+        only_ipv4_flows,
+        cache_directory=None,
+        cache_size=DEFAULT_CACHE_SIZE
+):
+    """
+    Loads the runs of every flow in a stats file and normalizes their
+    timestamps. The result is cached by the hash of the file's content, so
+    only changed files are preprocessed again
+    :param flow_stats_file: The stats file or directory to read
+    :type flow_stats_file: str
+    :param only_ipv4_flows: Whether or not to include only ipv4 flows or not
+    :type only_ipv4_flows: bool
+    :param cache_directory: The cache directory, None disables the cache
+    :type cache_directory: str
+    :param cache_size: The maximum size of the cache in bytes
+    :type cache_size: int
+    :return: The normalized runs, see load_runs, and the name of the
+             algorithm
+    :rtype: tuple
+    """
+    if cache_directory is None:
+        stats, algorithm = load_runs(flow_stats_file, only_ipv4_flows)
+        return normalize_runs(stats), algorithm
+
+    key = cache_key(flow_stats_file, "runs", int(only_ipv4_flows))
+    cached = load_cached(cache_directory, key)
+    if cached is not None:
+        return unpack_runs(cached)
+
+    stats, algorithm = load_runs(flow_stats_file, only_ipv4_flows)
+    stats = normalize_runs(stats)
+    store_cached(
+        cache_directory, key, pack_runs(stats, algorithm), cache_size
+    )
+    return stats, algorithm
+
+
+def pack_runs(stats, algorithm):
+    """
+    Concatenates the runs of all flows into flat arrays for the cache
+    :param stats: The runs, see load_runs
+    :type stats: dict
+    :param algorithm: The name of the algorithm
+    :type algorithm: str
+    :return: The arrays by name
+    :rtype: dict
+    """
+    flow_ids = list(stats.keys())
+    runs_list = [stats[flow_id]["runs"] for flow_id in flow_ids]
+    lengths = [len(runs[0]) for runs in runs_list]
+    starts, ends, values = concatenate_runs(runs_list)
+    return {
+        "meta": encode_json({
+            "algorithm": algorithm,
+            "flow_ids": flow_ids,
+            "flow_info": [stats[flow_id]["info"] for flow_id in flow_ids]
+        }),
+        "offsets": numpy.cumsum([0] + lengths).astype(numpy.int64),
+        "starts": starts,
+        "ends": ends,
+        "values": values
+    }
+
+
+def unpack_runs(arrays):
+    """
+    Restores runs packed by pack_runs
+    :param arrays: The arrays by name
+    :type arrays: dict
+    :return: The runs, see load_runs, and the name of the algorithm
+    :rtype: tuple
+    """
+    meta = decode_json(arrays["meta"])
+    offsets = arrays["offsets"]
+    stats = {}
+    for index, flow_id in enumerate(meta["flow_ids"]):
+        start, end = offsets[index], offsets[index + 1]
+        stats[flow_id] = {
+            "info": meta["flow_info"][index],
+            "runs": (
+                arrays["starts"][start:end],
+                arrays["ends"][start:end],
+                arrays["values"][start:end]
+            )
+        }
+    return stats, meta["algorithm"]
+
+
+def concatenate_runs(runs_list):
+    """
+    Concatenates the columns of runs
+    :param runs_list: The runs to concatenate
+    :type runs_list: list
+    :return: The concatenated starts, ends and values
+    :rtype: tuple
+    """
+    if len(runs_list) == 0:
+        return empty_runs()
+    return tuple(
+        numpy.concatenate([runs[column] for runs in runs_list])
+        for column in range(3)
+    )
+
+
+def paint_samples(end_milliseconds, byte_counts, durations):
+    """
+    Converts the samples of a flow into runs. The bytes of a sample are
+    spread evenly over the milliseconds of its duration, samples without a
+    duration cover their end millisecond. Where samples overlap, the
+    highest value is used. Values are never negative
+    :param end_milliseconds: The timestamps of the samples in milliseconds
+    :type end_milliseconds: numpy.ndarray
+    :param byte_counts: The byte counts of the samples
+    :type byte_counts: numpy.ndarray
+    :param durations: The durations of the samples in milliseconds
+    :type durations: numpy.ndarray
+    :return: The runs
+    :rtype: tuple
+    """
+    ends = numpy.asarray(end_milliseconds, dtype=numpy.int64)
+    byte_counts = numpy.asarray(byte_counts, dtype=numpy.int64)
+    starts = ends - numpy.asarray(durations, dtype=numpy.int64)
+
+    empty = starts >= ends
+    starts = numpy.where(empty, ends, starts)
+    ends = numpy.where(empty, ends + 1, ends)
+    lengths = ends - starts
+
+    # Negative byte counts, for example after a counter reset, are recorded
+    # as 0 like covered milliseconds without bytes
+    values = numpy.maximum(byte_counts, 0) // lengths
+
+    order = numpy.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = ends[order]
+    values = values[order]
+
+    if len(starts) < 2 or \
+            numpy.all(starts[1:] >= numpy.maximum.accumulate(ends)[:-1]):
+        return starts, ends, values
+
+    # Splits the samples at every boundary into elementary segments, each of
+    # which takes the maximum of all samples covering it. Since polling
+    # intervals rarely overlap by more than their neighbours, every sample
+    # only covers a few segments
+    boundaries = numpy.unique(numpy.concatenate((starts, ends)))
+    first_segments = numpy.searchsorted(boundaries, starts)
+    segment_counts = numpy.searchsorted(boundaries, ends) - first_segments
+    segments = expand_ranges(first_segments, segment_counts)
+
+    segment_values = numpy.zeros(len(boundaries) - 1, dtype=numpy.int64)
+    numpy.maximum.at(
+        segment_values, segments, numpy.repeat(values, segment_counts)
+    )
+    covered = numpy.zeros(len(boundaries) - 1, dtype=bool)
+    covered[segments] = True
+
+    return (
+        boundaries[:-1][covered],
+        boundaries[1:][covered],
+        segment_values[covered]
+    )
+
+
+def expand_ranges(firsts, counts):
+    """
+    Expands ranges of consecutive integers without a python loop
+    :param firsts: The first integer of every range
+    :type firsts: numpy.ndarray
+    :param counts: The length of every range
+    :type counts: numpy.ndarray
+    :return: The concatenated ranges
+    :rtype: numpy.ndarray
+    """
+    total = int(counts.sum())
+    offsets = numpy.cumsum(counts) - counts
+    return numpy.repeat(firsts - offsets, counts) + \
+        numpy.arange(total, dtype=numpy.int64)
+
+
+def sum_runs(runs_list):
+    """
+    Adds up runs using difference arrays. Every millisecond covered by at
+    least one of the runs is covered by the result
+    :param runs_list: The runs to add up
+    :type runs_list: list
+    :return: The sum as runs
+    :rtype: tuple
+    """
+    if len(runs_list) == 0:
+        return empty_runs()
+    if len(runs_list) == 1:
+        return runs_list[0]
+
+    starts, ends, values = concatenate_runs(runs_list)
+    if len(starts) == 0:
+        return empty_runs()
+
+    positions = numpy.concatenate((starts, ends))
+    order = numpy.argsort(positions, kind="stable")
+    positions = positions[order]
+    value_changes = numpy.concatenate((values, -values))[order]
+    coverage_changes = numpy.concatenate((
+        numpy.ones(len(starts), dtype=numpy.int64),
+        -numpy.ones(len(ends), dtype=numpy.int64)
+    ))[order]
+
+    boundaries, first_indices = numpy.unique(positions, return_index=True)
+    levels = numpy.cumsum(numpy.add.reduceat(value_changes, first_indices))
+    coverage = numpy.cumsum(
+        numpy.add.reduceat(coverage_changes, first_indices)
+    )
+
+    covered = coverage[:-1] > 0
+    return (
+        boundaries[:-1][covered],
+        boundaries[1:][covered],
+        levels[:-1][covered]
+    )
+
+
+def normalize_runs(stats):
+    """
+    Normalizes the timestamps of runs so that the earliest covered
+    millisecond of all flows is 0
+    :param stats: The runs as returned by load_runs
+    :type stats: dict
+    :return: The runs with normalized timestamps
+    :rtype: dict
+    """
+    starts = [flow["runs"][0] for flow in stats.values()
+              if len(flow["runs"][0]) > 0]
+    start_time = min(int(flow_starts[0]) for flow_starts in starts) \
+        if len(starts) > 0 else 0
+
+    return {
+        flow_id: {
+            "info": flow["info"],
+            "runs": (
+                flow["runs"][0] - start_time,
+                flow["runs"][1] - start_time,
+                flow["runs"][2]
+            )
+        }
+        for flow_id, flow in stats.items()
+    }
+
+
+def calculate_per_flow_runs(file_stats):
+    """
+    Calculates runs per flow
+    :param file_stats: The normalized runs per file
+    :type file_stats: dict
+    :return: The calculated runs in the following format:
+                 {flow_id: runs}
+    :rtype: dict
+    """
+    return {
+        file_id + "-" + flow_id: flow["runs"]
+        for file_id, flow_stats in file_stats.items()
+        for flow_id, flow in flow_stats.items()
+    }
+
+
+def calculate_per_ipv4_match_runs(file_stats):
+    """
+    Calculates runs per flow, grouped by ipv4 match
+    :param file_stats: The normalized runs per file
+    :type file_stats: dict
+    :return: The calculated runs in the following format:
+                 {flow_id: runs}
+    :rtype: dict
+    """
+    grouped = {}
+
+    for file_id, flow_stats in file_stats.items():
+        for flow in flow_stats.values():
+            new_flow_id = "{}-{}->{}".format(
+                file_id, flow["info"]["ipv4_src"], flow["info"]["ipv4_dst"]
+            )
+            grouped.setdefault(new_flow_id, []).append(flow["runs"])
+
+    return {
+        identifier: sum_runs(runs_list)
+        for identifier, runs_list in grouped.items()
+    }
+
+
+def calculate_total_link_utilization_runs(file_stats):
+    """
+    Calculates total link utilization by file
+    :param file_stats: The normalized runs per file
+    :type file_stats: dict
+    :return: The calculated runs in the following format:
+                 {file_id: runs}
+    :rtype: dict
+    """
+    return {
+        file_id: sum_runs([flow["runs"] for flow in flow_stats.values()])
+        for file_id, flow_stats in file_stats.items()
+    }
+
+
+def bin_runs(runs, smoothen_factor):
+    """
+    Splits runs at the boundaries of the smoothing intervals
+    :param runs: The runs to split
+    :type runs: tuple
+    :param smoothen_factor: The length of the smoothing intervals
+    :type smoothen_factor: int
+    :return: A tuple consisting of the interval, the value and the number of
+             covered milliseconds of every part, sorted by interval and value
+    :rtype: tuple
+    """
+    starts, ends, values = runs
+    first_bins = starts // smoothen_factor
+    bin_counts = (ends - 1) // smoothen_factor - first_bins + 1
+
+    parts = numpy.repeat(numpy.arange(len(starts)), bin_counts)
+    bins = expand_ranges(first_bins, bin_counts)
+    lengths = numpy.minimum(ends[parts], (bins + 1) * smoothen_factor) - \
+        numpy.maximum(starts[parts], bins * smoothen_factor)
+    values = values[parts]
+
+    order = numpy.lexsort((values, bins))
+    return bins[order], values[order], lengths[order]
+
+
+def aggregate_bins(bins, values, lengths, aggregation="median"):
+    """
+    Aggregates the values of every smoothing interval. Every value is
+    weighted by the number of milliseconds it covers.
+    Quantiles are taken from the sorted values of an interval without
+    interpolation, the median like sorted(values)[int(len(values) / 2)]
+    and the 95th percentile like sorted(values)[int(len(values) * 0.95)]
+    :param bins: The intervals of the values, sorted
+    :type bins: numpy.ndarray
+    :param values: The values, sorted within every interval
+    :type values: numpy.ndarray
+    :param lengths: The number of milliseconds covered by every value
+    :type lengths: numpy.ndarray
+    :param aggregation: The aggregation, see AGGREGATIONS
+    :type aggregation: str
+    :return: The covered intervals and their aggregated values as arrays
+    :rtype: tuple
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError("Unknown aggregation: {}".format(aggregation))
+    if len(bins) == 0:
+        return bins, values
+
+    covered_bins, first_parts = numpy.unique(bins, return_index=True)
+    counts = numpy.add.reduceat(lengths, first_parts)
+
+    if aggregation == "mean":
+        return covered_bins, \
+            numpy.add.reduceat(values * lengths, first_parts) / counts
+
+    cumulative = numpy.cumsum(lengths)
+    preceding = cumulative[first_parts] - lengths[first_parts]
+    if aggregation == "median":
+        ranks = counts // 2
+    elif aggregation == "p95":
+        ranks = counts * 95 // 100
+    else:
+        ranks = counts - 1
+
+    parts = numpy.searchsorted(cumulative, preceding + ranks, side="right")
+    return covered_bins, values[parts]
+
+
+def fill_bins(aggregated):
+    """
+    Converts aggregated intervals into dense arrays in which intervals
+    without covered milliseconds are 0. Every identifier is filled up to the
+    last interval of all identifiers
+    :param aggregated: The covered intervals and their values in the
+                       following format:
+                        {label: (intervals, values)}
+    :type aggregated: dict
+    :return: The dense intervals and values in the same format
+    :rtype: dict
+    """
+    maximum_timestamp = max(
+        [int(bins[-1]) for bins, _ in aggregated.values() if len(bins) > 0]
+        + [0]
+    )
+
+    filled = {}
+    for identifier, (bins, values) in aggregated.items():
+        length = maximum_timestamp
+        if len(bins) > 0:
+            length = max(length, int(bins[-1]) + 1)
+        dense = numpy.zeros(length, dtype=values.dtype)
+        dense[bins] = values
+        filled[identifier] = (numpy.arange(length, dtype=numpy.int64), dense)
+
+    return filled
+
+
+def aggregate_runs(calculated_runs, smoothen_factor, aggregation="median"):
+    """
+    Aggregates the calculated runs per smoothing interval
+    :param calculated_runs: The previously calculated runs
+    :type calculated_runs: dict
+    :param smoothen_factor: The length of the interval to which to smoothen
+                            the data
+    :type smoothen_factor: int
+    :param aggregation: The aggregation of the values of an interval, see
+                        AGGREGATIONS
+    :type aggregation: str
+    :return: The covered intervals and their values in the following format:
+                {label: (intervals, values)}
+    :rtype: dict
+    """
+    return {
+        identifier: aggregate_bins(
+            *bin_runs(runs, smoothen_factor), aggregation=aggregation
+        )
+        for identifier, runs in calculated_runs.items()
+    }
+
+
+def load_aggregated(
+        flow_stats_file,
+        mode,
+        only_ipv4_flows,
+        smoothen_factor,
+        aggregation="median",
+        cache_directory=None,
+        cache_size=DEFAULT_CACHE_SIZE
+):
+    """
+    Loads a stats file and aggregates its runs per smoothing interval.
+    Every mode only combines flows of the same file, so files can be
+    processed independently by worker processes. Only the aggregated
+    intervals are returned, which are cheap to send to the parent process
+    :param flow_stats_file: The stats file or directory to read
+    :type flow_stats_file: str
+    :param mode: The mode for data visualization, see CALCULATIONS
+    :type mode: str
+    :param only_ipv4_flows: Whether or not to include only ipv4 flows or not
+    :type only_ipv4_flows: bool
+    :param smoothen_factor: The length of the interval to which to smoothen
+                            the data
+    :type smoothen_factor: int
+    :param aggregation: The aggregation of the values of an interval, see
+                        AGGREGATIONS
+    :type aggregation: str
+    :param cache_directory: The cache directory, None disables the cache
+    :type cache_directory: str
+    :param cache_size: The maximum size of the cache in bytes
+    :type cache_size: int
+    :return: The aggregated intervals, see aggregate_runs, and the name of
+             the algorithm
+    :rtype: tuple
+    """
+    file_identifier = os.path.basename(flow_stats_file).rsplit(".", 1)[0]
+    stats, algorithm = load_normalized_runs(
+        flow_stats_file, only_ipv4_flows, cache_directory, cache_size
+    )
+    calculated = CALCULATIONS[mode]({file_identifier: stats})
+    return aggregate_runs(calculated, smoothen_factor, aggregation), algorithm
+
+
+CALCULATIONS = {
+    "per-flow": calculate_per_flow_runs,
+    "per-ipv4": calculate_per_ipv4_match_runs,
+    "total": calculate_total_link_utilization_runs
+}
+"""
+The calculation of the runs to visualize for every mode
+"""
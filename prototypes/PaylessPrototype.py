@@ -3,9 +3,12 @@ import sys
 from g3_payless.framework.MonitoringFramework import MonitoringFramework
 from g3_payless.monitoring.algorithms import algorithm_by_name
 from g3_payless.routing.DijkstraRouting import DijkstraRouting
+from g3_payless.routing.RoutingAlgorithm import RoutingAlgorithm
 # noinspection PyUnresolvedReferences
-from ryu.controller.ofp_event import EventOFPSwitchFeatures
-from ryu.ofproto.ofproto_v1_3_parser import OFPMatch, OFPActionOutput
+from ryu.controller.ofp_event import EventOFPSwitchFeatures, \
+    EventOFPStateChange
+from ryu.ofproto.ofproto_v1_3_parser import OFPMatch, OFPActionOutput, \
+    OFPBarrierRequest
 from ryu.lib.packet import ether_types
 from ryu.lib.packet.packet import Packet
 from ryu.lib.packet.ipv4 import ipv4
@@ -16,20 +19,61 @@ class PaylessPrototype(MonitoringFramework):
     Prototype SDN application using the g3_payless framework
     """
 
+    PROACTIVE_ROUTING = False
+    """
+    If True, the routes of the routing table are installed as soon as a
+    switch connects instead of reacting to PacketIn events
+    """
+
+    ROUTE_AGGREGATION = False
+    """
+    If True, routes are aggregated into fewer flow rules that only match the
+    destination wherever possible
+    """
+
+    PROACTIVE_HARD_TIMEOUT = 120
+    """
+    The hard timeout of proactively installed flow rules in seconds
+    """
+
+    PROACTIVE_REFRESH_INTERVAL = 110
+    """
+    The interval in seconds after which proactively installed flow rules are
+    replaced. Has to be shorter than the hard timeout
+    """
+
     def __init__(self, *args, **kwargs):
         """
         Reads environment variables and interprets them accordingly
         Environment variables can specify:
             * Which monitoring algorithm to use
-            * Where to store statistics
+            * Where and in which format to store statistics
             * The network topology file
+            * Whether to run background tasks cooperatively on Ryu's hub
+            * How many statistics samples to retain
+            * Whether to install routes proactively
+            * Whether to aggregate routes
         :param args: Positional Arguments
         :type args: list
         :param kwargs: Keyword Arguments
         :type kwargs: dict
         """
         self.algorithm_name = os.environ.get("ALGO", "payless")
+        self.COOPERATIVE = os.environ.get("COOPERATIVE") == "1"
+        self.STATS_FORMAT = os.environ.get("STATS_FORMAT", self.STATS_FORMAT)
+        self.PROACTIVE_ROUTING = os.environ.get("PROACTIVE_ROUTING") == "1"
+        self.ROUTE_AGGREGATION = os.environ.get("ROUTE_AGGREGATION") == "1"
+        self.STATISTICS_RETENTION = int(os.environ.get(
+            "STATISTICS_RETENTION", self.STATISTICS_RETENTION
+        ))
+        self.STATISTICS_DOWNSAMPLING = int(os.environ.get(
+            "STATISTICS_DOWNSAMPLING", self.STATISTICS_DOWNSAMPLING
+        ))
+        self.STATISTICS_ARCHIVE_RETENTION = int(os.environ.get(
+            "STATISTICS_ARCHIVE_RETENTION", self.STATISTICS_ARCHIVE_RETENTION
+        ))
         super(PaylessPrototype, self).__init__(*args, **kwargs)
+        self.replaced_flows = {}
 
         stats_file_path = os.environ.get("STATS_FILE")
         if stats_file_path is None:
@@ -38,7 +82,9 @@ class PaylessPrototype(MonitoringFramework):
         self.STATS_FILE = stats_file_path
 
         topology_file = os.environ["TOPOLOGY_FILE"]
-        self.routing_algo = DijkstraRouting(topology_file)
+        self.routing_algo = DijkstraRouting(
+            topology_file, self.ROUTE_AGGREGATION
+        )
 
     def define_algorithm(self):
         """
@@ -82,23 +128,23 @@ class PaylessPrototype(MonitoringFramework):
         if ipv4_info is None:
             return []
 
-        out_port, src_subnet, dst_subnet = \
-            self.routing_algo.calculate_routing_decision(
-                switch_id, ipv4_info.src, ipv4_info.dst
-            )
-        match = OFPMatch(
-            eth_type=ether_types.ETH_TYPE_IP,
-            ipv4_src=src_subnet,
-            ipv4_dst=dst_subnet
+        decision = self.routing_algo.calculate_routing_decision(
+            switch_id, ipv4_info.src, ipv4_info.dst
         )
+        if decision is None:
+            self.logger.debug("[S{}] No route from {} to {}, dropping packet"
+                              .format(switch_id, ipv4_info.src, ipv4_info.dst))
+            return []
+
+        out_port, src_subnet, dst_subnet = decision
+        match = self.create_route_match(src_subnet, dst_subnet)
 
         # If packets come in very quickly, the flow rule may not be installed
         # yet. To avoid creating new flows, we check if the flow rules were
         # already registered in active_flows.
-        for existing_flow in self.active_flows.values():
-            if existing_flow.is_ipv4_match_equal(switch_id, match):
-                self.send_pkt(datapath, message.data, out_port)
-                return []
+        if self.get_ipv4_flow(switch_id, match) is not None:
+            self.send_pkt(datapath, message.data, out_port)
+            return []
 
         actions = [OFPActionOutput(out_port)]
         flow_id = self.program_flow(
@@ -111,3 +157,141 @@ class PaylessPrototype(MonitoringFramework):
         )
         self.send_pkt(datapath, message.data, out_port)
         return [flow_id]
+
+    def handle_switch_features(self, event):
+        """
+        Installs the routes of the switch if routes are installed proactively
+        :param event: The SwitchFeatures event
+        :type event: EventOFPSwitchFeatures
+        :return: None
+        :rtype: None
+        """
+        if self.PROACTIVE_ROUTING:
+            datapath = event.msg.datapath
+            self.install_routes(datapath)
+            self.spawn(self.refresh_routes, datapath)
+
+    def handle_switch_disconnected(self, event):
+        """
+        Drops the flow rules of a switch that were waiting for their final
+        statistics after being replaced, since the reply won't arrive anymore
+        :param event: The StateChange event
+        :type event: EventOFPStateChange
+        :return: None
+        :rtype: None
+        """
+        for flow_id in self.replaced_flows.pop(event.datapath.id, set()):
+            self.remove_flow(flow_id)
+
+    # noinspection PyMethodMayBeStatic
+    def create_route_match(self, src_subnet, dst_subnet):
+        """
+        Creates the match of a flow rule that implements a route.
+        Aggregated routes from any source only match the destination.
+        :param src_subnet: The source subnet of the route
+        :type src_subnet: str
+        :param dst_subnet: The destination subnet of the route
+        :type dst_subnet: str
+        :return: The match
+        :rtype: OFPMatch
+        """
+        if src_subnet == RoutingAlgorithm.ANY_SUBNET:
+            return OFPMatch(
+                eth_type=ether_types.ETH_TYPE_IP,
+                ipv4_dst=dst_subnet
+            )
+        return OFPMatch(
+            eth_type=ether_types.ETH_TYPE_IP,
+            ipv4_src=src_subnet,
+            ipv4_dst=dst_subnet
+        )
+
+    def install_routes(self, datapath):
+        """
+        Installs flow rules for all routes of a switch, followed by a barrier.
+        Switches don't send FlowRemoved messages for flow rules that are
+        replaced in the process, so their final statistics are requested
+        before they are replaced. They are removed from the active flows
+        once these statistics have been recorded, see
+        handle_flow_stats_reply
+        :param datapath: The datapath to the switch
+        :type datapath: Datapath
+        :return: The generated flow IDs
+        :rtype: list
+        """
+        switch_id = datapath.id
+        switch_name = self.routing_algo.switch_names[switch_id]
+        routes = self.routing_algo.forwarding_table.get(switch_name, {})
+
+        # Flows whose final statistics never arrived, for example because
+        # they expired in the meantime, are removed without them
+        for flow_id in self.replaced_flows.pop(switch_id, set()):
+            self.remove_flow(flow_id)
+
+        route_matches = []
+        replaced_flow_ids = set()
+        for (src_subnet, dst_subnet), out_port in list(routes.items()):
+            match = self.create_route_match(src_subnet, dst_subnet)
+            replaced_flow = self.get_ipv4_flow(switch_id, match)
+            if replaced_flow is not None:
+                replaced_flow_ids.add(replaced_flow.flow_id)
+            route_matches.append((match, out_port))
+
+        if len(replaced_flow_ids) > 0:
+            self.replaced_flows[switch_id] = replaced_flow_ids
+            self.send_flowstats_request_for_flows(
+                switch_id, list(replaced_flow_ids)
+            )
+            # The statistics have to be collected before the flow rules
+            # are replaced and their counters are reset
+            datapath.send_msg(OFPBarrierRequest(datapath))
+
+        flow_ids = []
+        for match, out_port in route_matches:
+            flow_ids.append(self.program_flow(
+                datapath=datapath,
+                match=match,
+                actions=[OFPActionOutput(out_port)],
+                priority=10,
+                hard_timeout=self.PROACTIVE_HARD_TIMEOUT,
+                idle_timeout=0,
+                reset_counts=True
+            ))
+
+        datapath.send_msg(OFPBarrierRequest(datapath))
+        self.logger.info("[S{}] Installed {} routes proactively"
+                         .format(switch_id, len(flow_ids)))
+        return flow_ids
+
+    def handle_flow_stats_reply(self, event):
+        """
+        Removes replaced flow rules from the active flows once their final
+        statistics have been recorded
+        :param event: The FlowStatsReply event
+        :type event: EventOFPFlowStatsReply
+        :return: None
+        :rtype: None
+        """
+        replaced_flow_ids = self.replaced_flows.get(event.msg.datapath.id)
+        if not replaced_flow_ids:
+            return
+        for flow in event.msg.body:
+            if flow.cookie in replaced_flow_ids:
+                replaced_flow_ids.discard(flow.cookie)
+                self.remove_flow(flow.cookie)
+
+    def refresh_routes(self, datapath):
+        """
+        Periodically replaces the proactively installed flow rules of a switch
+        before they reach their hard timeout
+        :param datapath: The datapath to the switch
+        :type datapath: Datapath
+        :return: None
+        :rtype: None
+        """
+        while True:
+            self.sleep(self.PROACTIVE_REFRESH_INTERVAL)
+            if not datapath.is_active \
+                    or self.switches.get(datapath.id) is not datapath:
+                break
+            self.install_routes(datapath)
@@ -53,6 +53,28 @@ parser.add_argument("--payless-delta-2", type=int, default=1000000,
                     help="The delta 2 value for the payless algorithm "
                          "in bytes")
 parser.add_argument("--runs", type=int, default=1)
+parser.add_argument("--cooperative", action="store_true",
+                    help="Runs all monitoring tasks as greenthreads on "
+                         "ryu's event loop instead of OS threads")
+parser.add_argument("--proactive", action="store_true",
+                    help="Installs all routes as soon as a switch connects "
+                         "instead of reacting to PacketIn events")
+parser.add_argument("--aggregate-routes", action="store_true",
+                    help="Aggregates routes into fewer flow rules that only "
+                         "match the destination wherever possible")
+parser.add_argument("--stats-format", choices={"json", "log", "columnar"},
+                    default="json",
+                    help="Whether to periodically rewrite the statistics "
+                         "file or to append new samples to a log in the "
+                         "directory <out>.log or to binary files in the "
+                         "directory <out>.columnar")
+parser.add_argument("--retention", type=int, default=3600,
+                    help="Number of samples per flow kept at full resolution")
+parser.add_argument("--downsampling", type=int, default=10,
+                    help="Number of old samples merged into one once the "
+                         "retention is exceeded, 0 discards them instead")
+parser.add_argument("--archive-retention", type=int, default=3600,
+                    help="Number of downsampled samples kept per flow")
 args = parser.parse_args()
 
 
@@ -75,6 +97,13 @@ os.environ["PAYLESS_ALPHA"] = str(args.payless_alpha)
 os.environ["PAYLESS_BETA"] = str(args.payless_beta)
 os.environ["PAYLESS_DELTA_1"] = str(args.payless_delta_1)
 os.environ["PAYLESS_DELTA_2"] = str(args.payless_delta_2)
+os.environ["COOPERATIVE"] = "1" if args.cooperative else "0"
+os.environ["PROACTIVE_ROUTING"] = "1" if args.proactive else "0"
+os.environ["ROUTE_AGGREGATION"] = "1" if args.aggregate_routes else "0"
+os.environ["STATS_FORMAT"] = args.stats_format
+os.environ["STATISTICS_RETENTION"] = str(args.retention)
+os.environ["STATISTICS_DOWNSAMPLING"] = str(args.downsampling)
+os.environ["STATISTICS_ARCHIVE_RETENTION"] = str(args.archive_retention)
 
 for algorithm in args.algorithms:
     print("Performing experiment for algorithm {}".format(algorithm))
@@ -14,7 +14,8 @@ if __name__ == "__main__":
         url="https://git.scc.kit.edu/tm-praktika/ppsdn-2020/g3",
         packages=find_packages(),
         install_requires=[
-            "ryu"
+            "ryu",
+            "numpy"
         ],
         scripts=list(map(lambda x: os.path.join("bin", x), os.listdir("bin"))),
         include_package_data=True,